@@ -0,0 +1,101 @@
+"""Перенос старых появлений боссов в архивную базу.
+
+Появления с kill_time раньше горизонта вместе с отметками участия, дропом и
+предметами пачками переносятся из рабочей базы в архив (подключён к каждому
+соединению как схема archive, см. database.attach_archive). Последнее появление
+каждого босса никогда не переносится: от него считается следующий респавн.
+Сводки attendance_daily и attendance_totals остаются как есть — DELETE из
+boss_attendance их не меняет, поэтому статистика за всё время не теряет
+архивные отметки.
+"""
+import logging
+
+from database import ARCHIVE_TABLES
+
+logger = logging.getLogger(__name__)
+
+# Какой столбец связывает строку таблицы с появлением босса
+SPAWN_KEYS = {
+    'boss_kills': 'id',
+    'boss_attendance': 'boss_kill_id',
+    'boss_loot': 'boss_kill_id',
+    'loot_items': 'boss_kill_id',
+}
+
+SELECT_BATCH_SQL = '''
+    INSERT INTO temp.archive_batch (id)
+    SELECT id FROM main.boss_kills
+    WHERE kill_time < ?
+    AND id NOT IN (SELECT MAX(id) FROM main.boss_kills GROUP BY boss_name)
+    ORDER BY id
+    LIMIT ?
+'''
+
+
+def archive_batch(conn, before, batch_size):
+    """Переносит до batch_size появлений старше before (секунды Unix) двумя транзакциями.
+
+    Возвращает число перенесённых строк по таблицам; пустой словарь — переносить нечего.
+    Транзакция по двум базам в режиме WAL не атомарна, поэтому сначала пачка
+    копируется в архив и фиксируется, и только потом отдельной транзакцией
+    удаляется из рабочей базы. Сбой между ними оставляет строки в обеих базах;
+    следующий запуск выберет ту же пачку, заменит копии строками рабочей базы
+    (до удаления источник — она), и удаление завершится. Замена — DELETE и
+    INSERT, а не INSERT OR REPLACE: неявное удаление REPLACE не вызывает
+    триггеры, и полнотекстовый индекс архива получил бы предмет дважды.
+    """
+    moved = {}
+    with conn:
+        conn.execute('CREATE TEMP TABLE IF NOT EXISTS archive_batch (id INTEGER PRIMARY KEY)')
+        conn.execute('DELETE FROM temp.archive_batch')
+        if conn.execute(SELECT_BATCH_SQL, (before, batch_size)).rowcount == 0:
+            return moved
+
+        for table in ARCHIVE_TABLES:
+            columns = ', '.join(row['name'] for row in conn.execute(f'PRAGMA main.table_info({table})'))
+            batch_rows = f'{SPAWN_KEYS[table]} IN (SELECT id FROM temp.archive_batch)'
+            conn.execute(f'DELETE FROM archive.{table} WHERE {batch_rows}')
+            conn.execute(f'''
+                INSERT INTO archive.{table} ({columns})
+                SELECT {columns} FROM main.{table}
+                WHERE {batch_rows}
+            ''')
+
+    with conn:
+        # Сначала зависимые строки, появления последними
+        for table in reversed(ARCHIVE_TABLES):
+            cursor = conn.execute(f'DELETE FROM main.{table} WHERE {SPAWN_KEYS[table]} IN '
+                                  f'(SELECT id FROM temp.archive_batch)')
+            moved[table] = cursor.rowcount
+    return moved
+
+
+def reclaim_space(conn):
+    """Возвращает файловой системе страницы, освободившиеся после переноса; возвращает их число.
+
+    Только incremental vacuum: база, созданная до включения auto_vacuum = INCREMENTAL,
+    пропускается, пока для неё не выполнен `python manage.py vacuum` (до этого
+    свободные страницы переиспользуются SQLite, но файл не уменьшается).
+    """
+    if conn.execute('PRAGMA main.auto_vacuum').fetchone()[0] != 2:
+        logger.info("Рабочая база без auto_vacuum = INCREMENTAL, место не освобождается: "
+                    "выполните python manage.py vacuum при остановленном боте")
+        return 0
+    free_pages = conn.execute('PRAGMA main.freelist_count').fetchone()[0]
+    # execute() делает один шаг и освобождает одну страницу, executescript доводит до конца
+    conn.executescript('PRAGMA main.incremental_vacuum')
+    return free_pages
+
+
+def enable_incremental_vacuum(conn):
+    """Однократно включает auto_vacuum = INCREMENTAL полным VACUUM; True, если он понадобился.
+
+    VACUUM переписывает всю базу: нужна свободная память на диске примерно в
+    размер базы, и всё это время запись заблокирована. Поэтому он выполняется
+    только командой manage.py, а не задачей бота.
+    """
+    if conn.execute('PRAGMA main.auto_vacuum').fetchone()[0] == 2:
+        return False
+    conn.execute('PRAGMA main.auto_vacuum = INCREMENTAL')
+    conn.execute('VACUUM main')
+    return True
@@ -0,0 +1,103 @@
+import asyncio
+import logging
+
+import repository
+from config import ATTENDANCE_FLUSH_MS, ATTENDANCE_FLUSH_EVENTS
+
+logger = logging.getLogger(__name__)
+
+
+class AttendanceWriter:
+    """Очередь отметок участия: реакции копятся в памяти и пишутся пачкой.
+
+    На одно появление и игрока хранится только последнее действие (поставил
+    или снял ✅). Пачка записывается одной транзакцией через flush_interval
+    секунд после первого события или сразу, как набралось max_pending отметок.
+    """
+
+    def __init__(self, flush_interval=ATTENDANCE_FLUSH_MS / 1000, max_pending=ATTENDANCE_FLUSH_EVENTS):
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.events = 0
+        self.flushes = 0
+        self.written = 0
+        self._pending = {}
+        self._task = None
+        self._has_events = None
+        self._full = None
+        self._lock = None
+
+    def _ensure_started(self):
+        if self._task is None:
+            self._has_events = asyncio.Event()
+            self._full = asyncio.Event()
+            self._lock = asyncio.Lock()
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    def add(self, spawn_id, user_id, username, attended):
+        """Запоминает действие игрока; более раннее действие в том же появлении заменяется"""
+        self._ensure_started()
+        self._pending[(spawn_id, user_id)] = (username, attended)
+        self.events += 1
+        self._has_events.set()
+        if len(self._pending) >= self.max_pending:
+            self._full.set()
+
+    async def _run(self):
+        while True:
+            await self._has_events.wait()
+            try:
+                await asyncio.wait_for(self._full.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            await self.flush()
+
+    async def flush(self):
+        """Записывает накопленные отметки одной транзакцией"""
+        if self._lock is None:
+            return
+        async with self._lock:
+            if not self._pending:
+                self._has_events.clear()
+                return
+            batch, self._pending = self._pending, {}
+            self._has_events.clear()
+            self._full.clear()
+
+            events = [(spawn_id, user_id, username, attended)
+                      for (spawn_id, user_id), (username, attended) in batch.items()]
+            try:
+                await repository.record_attendance_batch(events)
+            except Exception as e:
+                logger.error(f"Ошибка записи отметок участия ({len(events)} шт.), повтор при следующей записи: {e}")
+                # Более новые действия, пришедшие во время записи, важнее возвращаемых
+                for key, value in batch.items():
+                    self._pending.setdefault(key, value)
+                self._has_events.set()
+                return
+
+            self.flushes += 1
+            self.written += len(events)
+            logger.info(f"Записано отметок участия: {len(events)} "
+                        f"(событий всего {self.events}, записей {self.flushes})")
+
+    def stats(self):
+        return {
+            'events': self.events,
+            'pending': len(self._pending),
+            'flushes': self.flushes,
+            'written': self.written,
+        }
+
+    async def close(self):
+        """Останавливает фоновую запись и сохраняет всё, что осталось в очереди"""
+        if self._task is not None:
+            # Под блокировкой фоновая задача не может быть посреди записи пачки
+            async with self._lock:
+                self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
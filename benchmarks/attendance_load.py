@@ -0,0 +1,164 @@
+"""Нагрузочный тест отметок участия: всплеск реакций ✅ на оповещения о боссах.
+
+Запуск из корня репозитория (база создаётся во временной папке):
+    python -m benchmarks.attendance_load
+    python -m benchmarks.attendance_load --users 100 --spawns 20 --window 1.5
+
+Один и тот же поток событий (игроки ставят и снимают ✅ в течение window
+секунд) проигрывается дважды: с записью каждой реакции отдельной транзакцией
+и через AttendanceWriter. Для каждого режима печатаются число транзакций,
+транзакций в секунду и время до записи последней отметки, затем итоговые
+отметки в базе сравниваются с ожидаемыми (последнее действие игрока), а
+сводки attendance_daily и attendance_totals, которые ведут триггеры, — с
+пересчётом по отметкам.
+Код возврата 1, если состояние базы расходится с ожидаемым.
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+
+# База теста — только во временной папке, даже если DB_PATH задан в окружении
+os.environ['DB_PATH'] = os.path.join(tempfile.mkdtemp(prefix='attendance_load_'), 'crp_clan.db')
+
+import database  # noqa: E402
+import migrations  # noqa: E402
+import repository  # noqa: E402
+from attendance_writer import AttendanceWriter  # noqa: E402
+from spawn_index import SpawnIndex  # noqa: E402
+
+
+def make_events(users, spawns, window, max_actions, first_message_id, seed):
+    """События (время, message_id, user_id, attended) и ожидаемые отметки {(message_id, user_id): attended}"""
+    rng = random.Random(seed)
+    events = []
+    expected = {}
+    for spawn in range(spawns):
+        message_id = first_message_id + spawn
+        for user_id in range(1, users + 1):
+            # Сначала игрок ставит ✅, потом может снять и поставить снова
+            actions = rng.randint(1, max_actions)
+            times = sorted(rng.uniform(0, window) for _ in range(actions))
+            for index, moment in enumerate(times):
+                events.append((moment, message_id, user_id, index % 2 == 0))
+            expected[(message_id, user_id)] = 1 if actions % 2 else 0
+    events.sort()
+    return events, expected
+
+
+class CommitCounter:
+    """Считает COMMIT на соединении потока базы"""
+
+    def __init__(self):
+        self.commits = 0
+
+    def __call__(self, statement):
+        if statement.strip().upper().startswith('COMMIT'):
+            self.commits += 1
+
+
+async def replay(events, index, handler):
+    start = time.perf_counter()
+    for moment, message_id, user_id, attended in events:
+        delay = moment - (time.perf_counter() - start)
+        if delay > 0:
+            await asyncio.sleep(delay)
+        # Как в обработчике реакции: появление берётся из индекса в памяти
+        handler(index.active(message_id).id, user_id, f"user{user_id}", attended)
+
+
+async def run_mode(name, events, spawns, first_message_id, batched, counter):
+    index = SpawnIndex()
+    for spawn in range(spawns):
+        index.put(await repository.mark_spawn(f"Boss {first_message_id + spawn}", 1893456000, 1893542400,
+                                              first_message_id + spawn, 1))
+
+    commits_before = counter.commits
+    start = time.perf_counter()
+    if batched:
+        writer = AttendanceWriter()
+        await replay(events, index, writer.add)
+        await writer.close()
+    else:
+        # Как в обработчике без очереди: каждая реакция — своя задача и своя транзакция
+        tasks = []
+        await replay(events, index,
+                     lambda *event: tasks.append(asyncio.create_task(repository.record_attendance(*event))))
+        await asyncio.gather(*tasks)
+    elapsed = time.perf_counter() - start
+
+    commits = counter.commits - commits_before
+    print(f"{name:<22}{len(events):>8}{commits:>12}{commits / elapsed:>16.1f}{elapsed:>12.2f}")
+    return commits
+
+
+async def main_async(args):
+    migrations.migrate()
+    counter = CommitCounter()
+    await repository._run(lambda: repository.get_db_connection().set_trace_callback(counter))
+
+    print(f"{'режим':<22}{'событий':>8}{'транзакций':>12}{'транзакций/с':>16}{'время, с':>12}")
+    failed = False
+    for name, batched, first_message_id in (('по одной', False, 1000), ('AttendanceWriter', True, 2000)):
+        events, expected = make_events(args.users, args.spawns, args.window, args.actions, first_message_id, args.seed)
+        await run_mode(name, events, args.spawns, first_message_id, batched, counter)
+
+        rows = await repository._run(lambda: repository.get_db_connection().execute('''
+            SELECT bk.message_id, ba.user_id, ba.attended, COUNT(*) OVER (PARTITION BY ba.boss_kill_id, ba.user_id) AS copies
+            FROM boss_attendance ba JOIN boss_kills bk ON ba.boss_kill_id = bk.id
+            WHERE bk.message_id BETWEEN ? AND ?
+        ''', (first_message_id, first_message_id + args.spawns - 1)).fetchall())
+        actual = {(row['message_id'], row['user_id']): row['attended'] for row in rows}
+        duplicates = sum(1 for row in rows if row['copies'] > 1)
+        # Нет строки — то же, что снятая отметка: поставил и снял в одной пачке
+        mismatched = sum(1 for key, value in expected.items() if actual.get(key, 0) != value)
+        unexpected = len(set(actual) - set(expected))
+        if mismatched or duplicates or unexpected:
+            failed = True
+            print(f"    РАСХОЖДЕНИЕ: неверных отметок {mismatched}, дублей {duplicates}, лишних строк {unexpected}")
+        else:
+            print(f"    итоговые отметки совпадают с ожидаемыми ({len(expected)})")
+
+    # Сводка после всех переключений отметок должна совпадать с пересчётом с нуля
+    def rollup_diff():
+        conn = repository.get_db_connection()
+        current = conn.execute('SELECT day, user_id, boss_name, attendance_count FROM attendance_daily '
+                               'WHERE attendance_count <> 0').fetchall()
+        rebuilt = conn.execute(database.ROLLUP_COUNTS_SQL).fetchall()
+        return set(map(tuple, current)) ^ {(row[0], row[1], row[2], row[4]) for row in rebuilt}
+
+    def totals_diff():
+        conn = repository.get_db_connection()
+        current = conn.execute('SELECT user_id, attendance_count FROM attendance_totals '
+                               'WHERE attendance_count <> 0').fetchall()
+        rebuilt = conn.execute(database.ATTENDANCE_TOTALS_SQL).fetchall()
+        return set(map(tuple, current)) ^ {(row[0], row[2]) for row in rebuilt}
+
+    for table, check in (('attendance_daily', rollup_diff), ('attendance_totals', totals_diff)):
+        diff = await repository._run(check)
+        if diff:
+            failed = True
+            print(f"    РАСХОЖДЕНИЕ сводки {table} с отметками: {len(diff)} строк")
+        else:
+            print(f"    сводка {table} совпадает с отметками")
+
+    await repository.close()
+    return 1 if failed else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=60, help='Игроков на оповещение')
+    parser.add_argument('--spawns', type=int, default=10, help='Оповещений (появлений боссов)')
+    parser.add_argument('--window', type=float, default=2.0, help='За сколько секунд приходят все реакции')
+    parser.add_argument('--actions', type=int, default=3, help='Максимум действий (поставил/снял) на игрока')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+    return asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,80 @@
+"""Проверка кеша OCR по похожести: скриншоты с разным текстом не делят запись.
+
+Запуск из корня репозитория (tesseract не нужен):
+    python -m benchmarks.cache_collisions
+
+Каждая сцена корпуса (benchmarks.make_corpus) рисуется заново с разными
+предметами в строках дропа: фон, окно чата и остальные сообщения те же,
+меняется только текст. Для каждого варианта считается хеш области чата, как в
+ocr_pipeline.recognize_image, и через OcrCache проверяется, что поиск по
+похожести не возвращает предметы другого варианта. Для сведения печатается,
+сколько копий, пересжатых в JPEG, находятся в кеше.
+Код возврата 1, если хотя бы два варианта с разным текстом получили одну запись.
+"""
+import io
+import itertools
+import os
+import sys
+import tempfile
+
+from PIL import Image
+
+import ocr_pipeline
+from benchmarks.make_corpus import ITEMS, SAMPLES, make_sample
+from ocr_cache import OcrCache, region_hash
+
+
+def variants(loot_lines):
+    """Наборы предметов: каждый предмет по отдельности и пары из первых пяти"""
+    singles = [[item] for item in ITEMS]
+    if loot_lines < 2:
+        return singles
+    return singles + [list(pair) for pair in itertools.permutations(ITEMS[:5], 2)]
+
+
+def similar_key(image):
+    region = ocr_pipeline.select_text_region(image)
+    return region_hash(image.crop(region)) if region else None
+
+
+def jpeg_copy(image):
+    buffer = io.BytesIO()
+    image.save(buffer, 'JPEG', quality=90)
+    return Image.open(buffer).convert('RGB')
+
+
+def check_scene(name, size, loot_lines, seed, cache):
+    collisions = 0
+    copies_found = 0
+    checked = 0
+    for index, items in enumerate(variants(loot_lines)):
+        image, expected = make_sample(size, loot_lines, seed, items)
+        key = similar_key(image)
+        if key is None:
+            print(f"{name}: область чата не найдена, поиск по похожести не выполняется")
+            continue
+        cached = cache.get_similar(key)
+        if cached is not None and cached != expected:
+            collisions += 1
+            print(f"{name}: {expected} получил запись {cached}")
+        cache.put(f"{name}:{index}", key, expected)
+        checked += 1
+        copies_found += cache.get_similar(similar_key(jpeg_copy(image))) == expected
+    print(f"{name:<28}вариантов {checked:>3}  совпадений с чужим текстом {collisions}  "
+          f"найдено JPEG-копий {copies_found}")
+    return collisions
+
+
+def main():
+    collisions = 0
+    with tempfile.TemporaryDirectory() as workdir:
+        cache = OcrCache(os.path.join(workdir, 'ocr_cache.db'), max_entries=100000)
+        for name, size, loot_lines, seed in SAMPLES:
+            if loot_lines:
+                collisions += check_scene(name, size, loot_lines, seed, cache)
+        cache._conn.close()
+    return 1 if collisions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,91 @@
+"""Микробенчмарк HSV маски: старый попиксельный цикл против векторной версии.
+
+Запуск из корня репозитория:
+    python -m benchmarks.hsv_mask
+    python -m benchmarks.hsv_mask --image screenshot.png --repeat 5
+
+Перед замером проверяется, что обе реализации дают одинаковую маску.
+"""
+import argparse
+import colorsys
+import sys
+import time
+
+import numpy as np
+from PIL import Image
+
+from image_filters import hsv_text_mask, text_color_mask
+
+# Типичные размеры скриншотов: телефон, 720p, 1080p, 1440p
+DEFAULT_SIZES = [(1170, 540), (1280, 720), (1920, 1080), (2560, 1440)]
+
+
+def legacy_hsv_mask(img_array):
+    """Исходная реализация из enhance_hsv: colorsys для каждого пикселя"""
+    hsv_array = np.zeros_like(img_array, dtype=float)
+    for y in range(img_array.shape[0]):
+        for x in range(img_array.shape[1]):
+            r, g, b = img_array[y, x] / 255.0
+            h, s, v = colorsys.rgb_to_hsv(r, g, b)
+            hsv_array[y, x] = [h * 360, s * 100, v * 100]
+    return hsv_text_mask(hsv_array)
+
+
+def vectorized_hsv_mask(img_array):
+    # Та же маска, что в enhance_hsv: векторно, полосами строк
+    return text_color_mask(img_array)
+
+
+def random_screenshot(width, height, seed=0):
+    """Случайное изображение: покрывает все ветки расчёта оттенка, включая серые пиксели"""
+    rng = np.random.default_rng(seed)
+    img_array = rng.integers(0, 256, size=(height, width, 3), dtype=np.uint8)
+    # Часть пикселей делаем серыми и с повторяющимися каналами
+    img_array[::7, :, 1] = img_array[::7, :, 0]
+    img_array[::11, :, :] = img_array[::11, :, :1]
+    return img_array
+
+
+def timed(func, img_array, repeat):
+    best = None
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(img_array)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--image', action='append', default=[], help='Реальный скриншот (можно несколько раз)')
+    parser.add_argument('--repeat', type=int, default=3, help='Повторов векторной версии (берётся лучший)')
+    parser.add_argument('--legacy-repeat', type=int, default=1, help='Повторов старого цикла')
+    parser.add_argument('--skip-legacy', action='store_true', help='Не запускать медленный цикл (без проверки совпадения)')
+    args = parser.parse_args()
+
+    if args.image:
+        samples = [(path, np.array(Image.open(path).convert('RGB'))) for path in args.image]
+    else:
+        samples = [(f"random {w}x{h}", random_screenshot(w, h)) for w, h in DEFAULT_SIZES]
+
+    failed = False
+    print(f"{'изображение':<28}{'цикл, с':>12}{'numpy, с':>12}{'ускорение':>12}  маска")
+    for name, img_array in samples:
+        fast_time, fast_mask = timed(vectorized_hsv_mask, img_array, args.repeat)
+        if args.skip_legacy:
+            print(f"{name:<28}{'-':>12}{fast_time:>12.3f}{'-':>12}  не проверялась")
+            continue
+
+        slow_time, slow_mask = timed(legacy_hsv_mask, img_array, args.legacy_repeat)
+        same = np.array_equal(slow_mask, fast_mask)
+        failed |= not same
+        print(f"{name:<28}{slow_time:>12.3f}{fast_time:>12.3f}{slow_time / fast_time:>11.0f}x  "
+              f"{'совпадает' if same else 'РАСХОДИТСЯ'}")
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
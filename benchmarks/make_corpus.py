@@ -0,0 +1,118 @@
+"""Генерация синтетического корпуса скриншотов дропа для benchmarks.ocr_suite.
+
+Запуск из корня репозитория (перезаписывает benchmarks/corpus):
+    python -m benchmarks.make_corpus
+
+Кадры имитируют игру: фон со «сценой» и полупрозрачное окно чата, где среди
+обычных сообщений есть строки «You acquired ... from ...» цветом редкости.
+Ожидаемые предметы записываются в corpus/expected.json.
+"""
+import json
+import os
+import random
+
+from PIL import Image, ImageDraw, ImageFont
+
+CORPUS_DIR = os.path.join(os.path.dirname(__file__), 'corpus')
+
+ITEMS = [
+    'Epic Sword', 'Rare Shield', 'Legendary Armor', 'Epic Helmet', 'Ancient Ring',
+    'Blue Crystal', 'Mystic Necklace', 'Guardian Boots', 'Dragon Scale', 'Sealed Skill Book',
+]
+BOSSES = ['Venatus - 60 LV', 'Ego - 70 LV', 'Livera - 75 LV', 'Metus - 93 LV', 'Baron - 88 LV']
+RARITY_COLORS = [(80, 220, 90), (80, 160, 255), (190, 90, 255), (255, 215, 60), (255, 70, 70)]
+CHATTER = [
+    '[Guild] Nice one, everyone!',
+    '[Party] gg',
+    '[System] The boss has appeared in the field.',
+    '[Guild] who needs the ring?',
+    '[System] Party member joined.',
+]
+
+# (имя файла, размер кадра, количество строк с дропом, seed)
+SAMPLES = [
+    ('desktop_1080p_single.png', (1920, 1080), 1, 1),
+    ('desktop_1080p_multi.png', (1920, 1080), 4, 2),
+    ('desktop_720p_multi.png', (1280, 720), 3, 3),
+    ('desktop_1440p_multi.png', (2560, 1440), 5, 4),
+    ('phone_landscape.png', (2340, 1080), 2, 5),
+    ('no_loot.png', (1920, 1080), 0, 6),
+]
+
+
+def load_font(size):
+    for name in ('DejaVuSans.ttf', 'arial.ttf'):
+        try:
+            return ImageFont.truetype(name, size)
+        except OSError:
+            pass
+    try:
+        return ImageFont.load_default(size=size)
+    except TypeError:
+        return ImageFont.load_default()
+
+
+def draw_scene(draw, width, height, rng):
+    """Фон: градиент неба и земли и несколько крупных фигур"""
+    for y in range(height):
+        shade = int(40 + 80 * y / height)
+        draw.line([(0, y), (width, y)], fill=(shade // 2, shade // 2 + 10, shade))
+    for _ in range(12):
+        x, y = rng.randrange(width), rng.randrange(height // 3, height)
+        r = rng.randrange(height // 20, height // 6)
+        color = tuple(rng.randrange(30, 140) for _ in range(3))
+        draw.ellipse([x - r, y - r, x + r, y + r], fill=color)
+
+
+def make_sample(size, loot_lines, seed, items=None):
+    """Кадр и ожидаемые предметы; items подменяет выбранные предметы, не меняя остальной кадр"""
+    rng = random.Random(seed)
+    width, height = size
+    image = Image.new('RGB', size)
+    draw_scene(ImageDraw.Draw(image), width, height, rng)
+
+    font_size = max(14, height // 45)
+    line_height = int(font_size * 1.4)
+    font = load_font(font_size)
+
+    lines = [(rng.choice(CHATTER), (235, 235, 235)) for _ in range(4)]
+    expected = []
+    for index in range(loot_lines):
+        item = rng.choice(ITEMS)
+        if items:
+            item = items[index % len(items)]
+        expected.append(item)
+        lines.insert(rng.randrange(len(lines) + 1),
+                     (f"[System] You acquired {item} from {rng.choice(BOSSES)}.", rng.choice(RARITY_COLORS)))
+
+    # Полупрозрачное окно чата в левом нижнем углу
+    box_width = int(width * 0.42)
+    box_height = line_height * len(lines) + 2 * font_size
+    top = height - box_height - height // 12
+    overlay = Image.new('RGBA', size, (0, 0, 0, 0))
+    ImageDraw.Draw(overlay).rectangle([width // 40, top, width // 40 + box_width, top + box_height],
+                                      fill=(10, 10, 15, 190))
+    image = Image.alpha_composite(image.convert('RGBA'), overlay).convert('RGB')
+
+    draw = ImageDraw.Draw(image)
+    for index, (text, color) in enumerate(lines):
+        draw.text((width // 40 + font_size, top + font_size + index * line_height), text, fill=color, font=font)
+    return image, expected
+
+
+def main():
+    os.makedirs(CORPUS_DIR, exist_ok=True)
+    expected = {}
+    for name, size, loot_lines, seed in SAMPLES:
+        image, items = make_sample(size, loot_lines, seed)
+        image.save(os.path.join(CORPUS_DIR, name), 'PNG', optimize=True)
+        expected[name] = items
+        print(f"{name}: {size[0]}x{size[1]}, предметов {len(items)}")
+
+    with open(os.path.join(CORPUS_DIR, 'expected.json'), 'w', encoding='utf-8') as f:
+        json.dump(expected, f, ensure_ascii=False, indent=2)
+        f.write('\n')
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+"""Проверка пиковой памяти конвейера OCR на одно изображение.
+
+Запуск из корня репозитория (Linux/macOS, нужен модуль resource):
+    python -m benchmarks.memory_bound
+
+Для каждого случая (обычные скриншоты, кадр на пределе OCR_MAX_PIXELS,
+огромный JPEG, который декодируется уменьшенным, и файлы сверх лимитов)
+recognize_image запускается в отдельном процессе. Прирост пикового RSS
+сравнивается с ocr_pipeline.peak_memory_bound. Tesseract заменён пустым
+движком: меряется только память декодирования и обработки изображения.
+Код возврата 1, если хотя бы один случай превысил оценку.
+"""
+import argparse
+import io
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+from benchmarks.make_corpus import make_sample
+from config import OCR_MAX_BYTES, OCR_MAX_PIXELS
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# (название, размер кадра, формат)
+CASES = [
+    ('png_1080p', (1920, 1080), 'PNG'),
+    ('png_4k', (3840, 2160), 'PNG'),
+    ('png_at_pixel_limit', (4000, 3000), 'PNG'),
+    ('jpeg_48mp_draft', (8000, 6000), 'JPEG'),
+    ('png_over_pixel_limit', (5000, 3000), 'PNG'),
+]
+
+
+class NullEngine:
+    """Движок без распознавания: все этапы конвейера проходят, текста нет"""
+
+    name = 'null'
+
+    def image_to_data(self, image, config):
+        return {'text': [], 'conf': [], 'page_num': [], 'block_num': [], 'par_num': [], 'line_num': []}
+
+
+def max_rss_bytes():
+    # ru_maxrss наследуется от родителя через fork, поэтому на Linux берём VmHWM процесса
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux отдаёт килобайты, macOS — байты
+    return usage if sys.platform == 'darwin' else usage * 1024
+
+
+def run_child(path):
+    """Распознавание одного файла в этом процессе; печатает JSON с приростом пикового RSS"""
+    import ocr_pipeline
+
+    ocr_pipeline._engine = NullEngine()
+    with open(path, 'rb') as f:
+        image_data = f.read()
+    baseline = max_rss_bytes()
+    try:
+        ocr_pipeline.recognize_image(image_data, use_cache=False)
+        error = None
+    except ValueError as e:
+        error = str(e)
+    print(json.dumps({'peak_bytes': max_rss_bytes() - baseline, 'error': error}, ensure_ascii=False))
+
+
+def encode(image, image_format):
+    buffer = io.BytesIO()
+    image.save(buffer, image_format, quality=90)
+    return buffer.getvalue()
+
+
+def measure(name, image_data, pixels, workdir):
+    path = os.path.join(workdir, name)
+    with open(path, 'wb') as f:
+        f.write(image_data)
+    repo = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [repo, os.environ.get('PYTHONPATH')])))
+    # Рабочая папка временная: база и кеш конвейера не трогают файлы репозитория
+    output = subprocess.run([sys.executable, '-m', 'benchmarks.memory_bound', '--child', path],
+                            cwd=workdir, env=env, capture_output=True, text=True, check=True).stdout
+    result = json.loads(output.strip().splitlines()[-1])
+
+    import ocr_pipeline
+    bound = ocr_pipeline.peak_memory_bound(min(pixels, OCR_MAX_PIXELS), len(image_data))
+    ok = result['peak_bytes'] <= bound
+    status = 'отклонён' if result['error'] else 'обработан'
+    print(f"{name:<24}{len(image_data) / 2 ** 20:>9.1f} МБ{pixels / 1e6:>8.1f} Мп{result['peak_bytes'] / 2 ** 20:>10.0f} МБ"
+          f"{bound / 2 ** 20:>10.0f} МБ  {status}, {'в пределах' if ok else 'ПРЕВЫШЕНИЕ'}")
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--child', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if resource is None:
+        print("Модуль resource недоступен на этой платформе", file=sys.stderr)
+        return 1
+    if args.child:
+        run_child(args.child)
+        return 0
+
+    print(f"Лимиты: {OCR_MAX_BYTES / 2 ** 20:.0f} МБ, {OCR_MAX_PIXELS / 1e6:.1f} Мп")
+    print(f"{'случай':<24}{'файл':>12}{'кадр':>11}{'пик RSS':>13}{'оценка':>13}")
+    failed = False
+    with tempfile.TemporaryDirectory() as workdir:
+        for name, size, image_format in CASES:
+            image, _ = make_sample(size, 3, seed=len(name))
+            failed |= not measure(name, encode(image, image_format), size[0] * size[1], workdir)
+            del image
+
+        # Файл сверх лимита по байтам отклоняется до декодирования
+        oversized = os.urandom(OCR_MAX_BYTES + 1)
+        failed |= not measure('bytes_over_limit', oversized, 0, workdir)
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
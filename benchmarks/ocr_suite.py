@@ -0,0 +1,217 @@
+"""Бенчмарк и проверка точности OCR на корпусе скриншотов с известным дропом.
+
+Запуск из корня репозитория (работает без сети, нужен только tesseract):
+    python -m benchmarks.ocr_suite
+    python -m benchmarks.ocr_suite --output runs/today.json --compare runs/baseline.json
+
+Для каждого скриншота замеряется время этапов (декодирование, область текста,
+обработка, каждый проход tesseract, извлечение предметов), пиковая память и
+точность/полнота найденных предметов. Время и память замеряются разными
+прогонами: tracemalloc замедляет выделение памяти и исказил бы время этапов.
+Полный отчёт — JSON (stdout или --output), краткая таблица — в stderr.
+
+С --compare код возврата 1, если точность или полнота упали больше чем на
+--accuracy-tolerance или общее/медианное время выросло больше чем на
+--latency-tolerance (доля) относительно прошлого отчёта.
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+from collections import Counter
+
+import ocr_pipeline
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+CORPUS_DIR = os.path.join(os.path.dirname(__file__), 'corpus')
+
+# Показатели, рост которых больше допуска — регрессия скорости
+LATENCY_KEYS = ('total_seconds', 'median_seconds')
+# Показатели, падение которых больше допуска — регрессия точности
+ACCURACY_KEYS = ('precision', 'recall')
+
+
+def normalize(item):
+    return ' '.join(item.lower().split())
+
+
+def score_items(found, expected):
+    """Точность и полнота по мультимножествам предметов"""
+    found_counts = Counter(normalize(item) for item in found)
+    expected_counts = Counter(normalize(item) for item in expected)
+    true_positive = sum((found_counts & expected_counts).values())
+    return {
+        'matched': true_positive,
+        'found_count': sum(found_counts.values()),
+        'expected_count': sum(expected_counts.values()),
+    }
+
+
+def ratio(numerator, denominator):
+    # Пустой знаменатель: нечего было найти/ничего не найдено — считаем идеальным результатом
+    return round(numerator / denominator, 4) if denominator else 1.0
+
+
+def run_sample(path, expected):
+    with open(path, 'rb') as f:
+        image_data = f.read()
+
+    start = time.perf_counter()
+    with ocr_pipeline.collect_timings() as timings:
+        items = ocr_pipeline.recognize_image(image_data, use_cache=False)
+    total = time.perf_counter() - start
+
+    # Пиковая память — отдельным прогоном, чтобы tracemalloc не влиял на время
+    tracemalloc.start()
+    ocr_pipeline.recognize_image(image_data, use_cache=False)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    stages = {}
+    for stage, seconds in timings:
+        stages[stage] = round(stages.get(stage, 0.0) + seconds, 4)
+
+    counts = score_items(items, expected)
+    return {
+        'file': os.path.basename(path),
+        'seconds': round(total, 4),
+        'stages': stages,
+        'tesseract_passes': sum(1 for stage, _ in timings if stage.startswith('tesseract:')),
+        'peak_memory_mb': round(peak / (1024 * 1024), 2),
+        'items': items,
+        'expected': expected,
+        'precision': ratio(counts['matched'], counts['found_count']),
+        'recall': ratio(counts['matched'], counts['expected_count']),
+        **counts,
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except Exception:
+        return None
+
+
+def max_rss_mb():
+    """Пиковый RSS процесса: ru_maxrss в КиБ под Linux и в байтах под macOS"""
+    if resource is None:
+        return None
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        max_rss /= 1024
+    return round(max_rss / 1024, 2)
+
+
+def summarize(samples):
+    matched = sum(sample['matched'] for sample in samples)
+    found = sum(sample['found_count'] for sample in samples)
+    expected = sum(sample['expected_count'] for sample in samples)
+    seconds = sorted(sample['seconds'] for sample in samples)
+    stage_totals = {}
+    for sample in samples:
+        for stage, value in sample['stages'].items():
+            stage_totals[stage] = round(stage_totals.get(stage, 0.0) + value, 4)
+    return {
+        'images': len(samples),
+        'total_seconds': round(sum(seconds), 4),
+        'median_seconds': seconds[len(seconds) // 2] if seconds else 0.0,
+        'tesseract_passes': sum(sample['tesseract_passes'] for sample in samples),
+        'peak_memory_mb': max((sample['peak_memory_mb'] for sample in samples), default=0.0),
+        'max_rss_mb': max_rss_mb(),
+        'precision': ratio(matched, found),
+        'recall': ratio(matched, expected),
+        'stage_seconds': stage_totals,
+    }
+
+
+def find_regressions(summary, baseline, accuracy_tolerance, latency_tolerance):
+    """Показатели, ухудшившиеся сильнее допуска: [(показатель, было, стало)]"""
+    regressions = []
+    for key in ACCURACY_KEYS:
+        old = baseline.get(key)
+        if isinstance(old, (int, float)) and summary[key] < old - accuracy_tolerance:
+            regressions.append((key, old, summary[key]))
+    for key in LATENCY_KEYS:
+        old = baseline.get(key)
+        if isinstance(old, (int, float)) and summary[key] > old * (1 + latency_tolerance):
+            regressions.append((key, old, summary[key]))
+    return regressions
+
+
+def print_comparison(summary, baseline_path, accuracy_tolerance, latency_tolerance):
+    """Печатает сравнение с прошлым отчётом; возвращает список регрессий"""
+    with open(baseline_path, encoding='utf-8') as f:
+        baseline = json.load(f)['summary']
+    print(f"\nСравнение с {baseline_path}:", file=sys.stderr)
+    for key in ('total_seconds', 'median_seconds', 'tesseract_passes', 'peak_memory_mb', 'precision', 'recall'):
+        old, new = baseline.get(key), summary[key]
+        delta = f"{new - old:+.4g}" if isinstance(old, (int, float)) else 'нет данных'
+        print(f"  {key:<18}{old!s:>12} → {new!s:<12}{delta}", file=sys.stderr)
+
+    regressions = find_regressions(summary, baseline, accuracy_tolerance, latency_tolerance)
+    for key, old, new in regressions:
+        print(f"Регрессия: {key} {old} → {new}", file=sys.stderr)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--corpus', default=CORPUS_DIR, help='Папка с изображениями и expected.json')
+    parser.add_argument('--output', help='Куда записать JSON отчёт (по умолчанию stdout)')
+    parser.add_argument('--compare', help='JSON отчёт прошлого запуска для сравнения')
+    parser.add_argument('--accuracy-tolerance', type=float, default=0.0,
+                        help='Допустимое падение точности и полноты (по умолчанию 0)')
+    parser.add_argument('--latency-tolerance', type=float, default=0.2,
+                        help='Допустимый рост времени, доля (по умолчанию 0.2 — на 20%%)')
+    args = parser.parse_args()
+
+    with open(os.path.join(args.corpus, 'expected.json'), encoding='utf-8') as f:
+        manifest = json.load(f)
+
+    engine = ocr_pipeline.get_engine()  # загрузка модели не входит в замеры
+    samples = []
+    for name, expected in manifest.items():
+        sample = run_sample(os.path.join(args.corpus, name), expected)
+        samples.append(sample)
+        print(f"{name:<32}{sample['seconds']:>8.2f} с  проходов {sample['tesseract_passes']}  "
+              f"P {sample['precision']:.2f}  R {sample['recall']:.2f}  {sample['peak_memory_mb']:.0f} МБ",
+              file=sys.stderr)
+
+    summary = summarize(samples)
+    report = {
+        'created_at': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'revision': git_revision(),
+        'engine': engine.name,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'summary': summary,
+        'samples': samples,
+    }
+
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        os.makedirs(os.path.dirname(args.output) or '.', exist_ok=True)
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+
+    print(f"\nИтого: {summary['images']} изображений, {summary['total_seconds']:.2f} с, "
+          f"точность {summary['precision']:.2f}, полнота {summary['recall']:.2f}", file=sys.stderr)
+    if args.compare and print_comparison(summary, args.compare, args.accuracy_tolerance, args.latency_tolerance):
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
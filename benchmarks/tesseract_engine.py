@@ -0,0 +1,68 @@
+"""Накладные расходы на вызов tesseract: процесс на каждый вызов против tesserocr.
+
+Запуск из корня репозитория:
+    python -m benchmarks.tesseract_engine
+    python -m benchmarks.tesseract_engine --image screenshot.png --calls 20
+
+На маленьком изображении время распознавания почти нулевое, поэтому
+разница между движками — это и есть накладные расходы на вызов.
+"""
+import argparse
+import statistics
+import sys
+import time
+
+from PIL import Image, ImageDraw
+
+from ocr_engine import PytesseractEngine, TesserocrEngine, tesserocr
+from config import TESSDATA_PATH
+
+CONFIG = r'--oem 3 --psm 6'
+
+
+def text_line_image():
+    image = Image.new('L', (420, 40), 255)
+    ImageDraw.Draw(image).text((8, 12), "You acquired Epic Sword from Venatus", fill=0)
+    return image
+
+
+def measure(engine, image, calls):
+    engine.image_to_data(image, CONFIG)  # прогрев: загрузка модели не входит в замер
+    timings = []
+    for _ in range(calls):
+        start = time.perf_counter()
+        engine.image_to_data(image, CONFIG)
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--image', action='append', default=[], help='Скриншот для замера (можно несколько раз)')
+    parser.add_argument('--calls', type=int, default=10, help='Вызовов на каждый движок')
+    args = parser.parse_args()
+
+    samples = [('строка текста', text_line_image())]
+    samples += [(path, Image.open(path).convert('RGB')) for path in args.image]
+
+    engines = [PytesseractEngine()]
+    if tesserocr is not None:
+        engines.append(TesserocrEngine(path=TESSDATA_PATH))
+    else:
+        print("tesserocr не установлен: замер только для pytesseract")
+
+    print(f"{'изображение':<30}{'движок':<14}{'медиана, мс':>14}")
+    for name, image in samples:
+        results = {}
+        for engine in engines:
+            median = measure(engine, image, args.calls)
+            results[engine.name] = median
+            print(f"{name:<30}{engine.name:<14}{median * 1000:>14.1f}")
+        if len(results) == 2:
+            overhead = results['pytesseract'] - results['tesserocr']
+            print(f"{'':<30}{'разница':<14}{overhead * 1000:>14.1f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,89 @@
+import os
+from dotenv import load_dotenv
+
+# Загрузка переменных окружения
+load_dotenv()
+
+# Путь к tesseract (по умолчанию ищется в PATH; под Windows — см. .env.example)
+TESSERACT_CMD = os.getenv('TESSERACT_CMD', 'tesseract')
+
+# Движок OCR: auto (tesserocr, если установлен), tesserocr или pytesseract
+OCR_ENGINE = os.getenv('OCR_ENGINE', 'auto')
+# Папка tessdata для tesserocr (по умолчанию берётся из установки tesseract)
+TESSDATA_PATH = os.getenv('TESSDATA_PATH')
+
+# Количество процессов для OCR (распознавание не блокирует бота)
+OCR_WORKERS = max(1, int(os.getenv('OCR_WORKERS', max(1, (os.cpu_count() or 2) - 1))))
+
+# Общая HTTP-сессия бота: размер пула соединений и таймаут загрузки (секунды)
+HTTP_POOL_SIZE = int(os.getenv('HTTP_POOL_SIZE', 10))
+HTTP_TIMEOUT = float(os.getenv('HTTP_TIMEOUT', 30))
+
+# Кеш результатов OCR по хешу изображения
+OCR_CACHE_PATH = os.getenv('OCR_CACHE_PATH', 'ocr_cache.db')
+OCR_CACHE_MAX_ENTRIES = int(os.getenv('OCR_CACHE_MAX_ENTRIES', 5000))
+# Искать копии скриншота по перцептивному хешу области чата (без области — не ищем).
+# Выключено по умолчанию: совпадение хеша принимается без OCR
+OCR_CACHE_PHASH = os.getenv('OCR_CACHE_PHASH', '0') == '1'
+
+# Минимальная средняя уверенность tesseract (0-100) в строках с дропом,
+# при которой остальные этапы распознавания пропускаются
+OCR_MIN_CONFIDENCE = float(os.getenv('OCR_MIN_CONFIDENCE', 75))
+
+# Лимиты на одно изображение для OCR: размер файла в байтах и число пикселей.
+# Больший JPEG декодируется уменьшенным, остальные файлы сверх лимита не распознаются
+# (скриншот всё равно сохраняется, дроп записывается как нераспознанный)
+OCR_MAX_BYTES = int(os.getenv('OCR_MAX_BYTES', 20 * 1024 * 1024))
+OCR_MAX_PIXELS = int(os.getenv('OCR_MAX_PIXELS', 12_000_000))
+
+# Высота строки текста в пикселях, к которой масштабируется изображение перед OCR
+# (LSTM модель tesseract работает со строками высотой около 36 px); 0 — не масштабировать
+OCR_TARGET_TEXT_HEIGHT = int(os.getenv('OCR_TARGET_TEXT_HEIGHT', 36))
+
+# Обрезка скриншота до области лога чата перед OCR
+OCR_ROI = os.getenv('OCR_ROI', '1') == '1'
+# JSON файл с сохранёнными областями для известных разрешений:
+# {"1920x1080": [left, top, right, bottom], ...}
+OCR_ROI_LAYOUTS = os.getenv('OCR_ROI_LAYOUTS', 'roi_layouts.json')
+
+# Отладочные изображения OCR: off, all, sample (каждый N-й скриншот), failures (только нераспознанные)
+DEBUG_CAPTURE_MODE = os.getenv('DEBUG_CAPTURE_MODE', 'off')
+DEBUG_CAPTURE_SAMPLE = int(os.getenv('DEBUG_CAPTURE_SAMPLE', 10))
+DEBUG_CAPTURE_DIR = os.getenv('DEBUG_CAPTURE_DIR', 'debug_images')
+# Ограничения папки с отладочными файлами: количество, мегабайты, возраст в часах
+DEBUG_CAPTURE_MAX_FILES = int(os.getenv('DEBUG_CAPTURE_MAX_FILES', 200))
+DEBUG_CAPTURE_MAX_MB = int(os.getenv('DEBUG_CAPTURE_MAX_MB', 200))
+DEBUG_CAPTURE_MAX_AGE_HOURS = int(os.getenv('DEBUG_CAPTURE_MAX_AGE_HOURS', 72))
+
+# Каталог известных предметов для исправления ошибок OCR (только проверенные вручную названия)
+ITEM_CATALOGUE_PATH = os.getenv('ITEM_CATALOGUE_PATH', 'items_catalogue.txt')
+# Минимальная оценка (0-1), при которой распознанный текст заменяется названием из словаря
+ITEM_MATCH_MIN_SCORE = float(os.getenv('ITEM_MATCH_MIN_SCORE', 0.75))
+# Оценка, при которой результат принимается без дополнительных проходов tesseract
+ITEM_MATCH_ACCEPT_SCORE = float(os.getenv('ITEM_MATCH_ACCEPT_SCORE', 0.9))
+# Как часто процесс OCR перечитывает каталог предметов (секунды)
+ITEM_INDEX_REFRESH = int(os.getenv('ITEM_INDEX_REFRESH', 600))
+
+# База данных бота и сайта. Соединения переиспользуются в каждом потоке и работают в режиме WAL:
+# чтение сайтом не блокирует запись ботом. Таймаут ожидания блокировки — в миллисекундах,
+# кеш страниц и размер отображения файла в память — в мегабайтах
+DB_PATH = os.getenv('DB_PATH', 'crp_clan.db')
+DB_BUSY_TIMEOUT_MS = int(os.getenv('DB_BUSY_TIMEOUT_MS', 5000))
+# Сколько раз по DB_BUSY_TIMEOUT_MS ждать блокировку записи, которую держит миграция
+# или раскладка дропа в другом процессе, прежде чем сдаться с ошибкой
+DB_LOCK_ATTEMPTS = max(1, int(os.getenv('DB_LOCK_ATTEMPTS', 12)))
+DB_CACHE_MB = int(os.getenv('DB_CACHE_MB', 16))
+DB_MMAP_MB = int(os.getenv('DB_MMAP_MB', 128))
+
+# Отметки участия (реакции ✅) копятся в памяти и записываются одной транзакцией
+# раз в ATTENDANCE_FLUSH_MS миллисекунд или сразу после ATTENDANCE_FLUSH_EVENTS разных отметок
+ATTENDANCE_FLUSH_MS = int(os.getenv('ATTENDANCE_FLUSH_MS', 300))
+ATTENDANCE_FLUSH_EVENTS = int(os.getenv('ATTENDANCE_FLUSH_EVENTS', 50))
+
+# Архив: появления старше ARCHIVE_AFTER_DAYS дней вместе с отметками и дропом раз в
+# ARCHIVE_INTERVAL_HOURS часов переносятся в отдельную базу, по ARCHIVE_BATCH появлений
+# за транзакцию. По умолчанию архив лежит рядом с основной базой: crp_clan_archive.db
+ARCHIVE_DB_PATH = os.getenv('ARCHIVE_DB_PATH', os.path.splitext(DB_PATH)[0] + '_archive.db')
+ARCHIVE_AFTER_DAYS = int(os.getenv('ARCHIVE_AFTER_DAYS', 90))
+ARCHIVE_INTERVAL_HOURS = int(os.getenv('ARCHIVE_INTERVAL_HOURS', 24))
+ARCHIVE_BATCH = int(os.getenv('ARCHIVE_BATCH', 200))
@@ -1,123 +1,689 @@
+import os
 import sqlite3
 import logging
+import threading
+import time
 from datetime import datetime, timedelta
 
+from config import DB_PATH, DB_BUSY_TIMEOUT_MS, DB_LOCK_ATTEMPTS, DB_CACHE_MB, DB_MMAP_MB, ARCHIVE_DB_PATH
+
 logger = logging.getLogger(__name__)
 
+_local = threading.local()
+
+# Текст в boss_loot.loot_text, когда со скриншота ничего не распознано
+LOOT_NOT_RECOGNIZED = "Не удалось распознать дроп"
+
+# kill_time, respawn и created_at хранятся целыми секундами Unix, на сайте показываются в этом формате
+TIME_FORMAT = "%Y-%m-%d %H:%M"
+
+# Текстовые даты до перевода на секунды: формат бота, формат после старой
+# миграции (с секундами) и самый первый dd.mm.yy-HH:MM
+LEGACY_TIME_FORMATS = ("%Y-%m-%d %H:%M", "%Y-%m-%d %H:%M:%S", "%d.%m.%y-%H:%M")
+
+# Столбцы таблиц. Таблица со столбцами времени пересоздаётся по этому же описанию
+TABLES = {
+    'boss_kills': '''
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        boss_name TEXT,
+        kill_time INTEGER,
+        respawn INTEGER,
+        message_id INTEGER,
+        channel_id INTEGER,
+        is_killed INTEGER DEFAULT 0,
+        respawn_notified INTEGER DEFAULT 0
+    ''',
+    'boss_attendance': '''
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        boss_kill_id INTEGER,
+        user_id INTEGER,
+        username TEXT,
+        attended INTEGER DEFAULT 0,
+        FOREIGN KEY (boss_kill_id) REFERENCES boss_kills (id)
+    ''',
+    'boss_loot': '''
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        boss_kill_id INTEGER,
+        user_id INTEGER,
+        username TEXT,
+        screenshot_path TEXT,
+        loot_text TEXT,
+        created_at INTEGER,
+        FOREIGN KEY (boss_kill_id) REFERENCES boss_kills (id)
+    ''',
+    # Дроп по одному предмету в строке: предмет, появление, игрок, время
+    'loot_items': '''
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        loot_id INTEGER,
+        boss_kill_id INTEGER,
+        user_id INTEGER,
+        username TEXT,
+        item TEXT,
+        created_at INTEGER,
+        FOREIGN KEY (loot_id) REFERENCES boss_loot (id),
+        FOREIGN KEY (boss_kill_id) REFERENCES boss_kills (id)
+    ''',
+    'web_users': '''
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        discord_id INTEGER UNIQUE,
+        username TEXT,
+        is_admin INTEGER DEFAULT 0,
+        created_at TEXT
+    ''',
+}
+
+# Таблицы, старые строки которых переносятся в архив (archiver.py), в порядке зависимостей
+ARCHIVE_TABLES = ('boss_kills', 'boss_attendance', 'boss_loot', 'loot_items')
+
+# Временные представления соединения: рабочая база и архив вместе, для статистики за всё время
+ARCHIVE_VIEWS = {
+    'all_boss_kills': 'boss_kills',
+    'all_boss_attendance': 'boss_attendance',
+    'all_loot_items': 'loot_items',
+}
+
+# Столбцы времени в секундах Unix по таблицам
+TIME_COLUMNS = {
+    'boss_kills': ('kill_time', 'respawn'),
+    'boss_loot': ('created_at',),
+}
+
+# Вторичные индексы. Каждый нужен конкретному частому запросу ниже;
+# проверка планов запросов: python manage.py explain
+INDEXES = [
+    # Снятие ✅ со старого оповещения ищет появление по message_id
+    'CREATE INDEX IF NOT EXISTS idx_boss_kills_message_id ON boss_kills (message_id)',
+    # Последнее появление каждого босса (MAX(id) по boss_name) и топ боссов
+    'CREATE INDEX IF NOT EXISTS idx_boss_kills_boss_name_id ON boss_kills (boss_name, id)',
+    # Статистика за период
+    'CREATE INDEX IF NOT EXISTS idx_boss_kills_kill_time ON boss_kills (kill_time)',
+    # Ближайшие респавны на главной странице
+    'CREATE INDEX IF NOT EXISTS idx_boss_kills_respawn ON boss_kills (respawn)',
+    # Одна отметка участия на игрока и появление босса
+    'CREATE UNIQUE INDEX IF NOT EXISTS idx_boss_attendance_kill_user ON boss_attendance (boss_kill_id, user_id)',
+    # Список игроков на странице админа (покрывающий индекс)
+    'CREATE INDEX IF NOT EXISTS idx_boss_attendance_username_user ON boss_attendance (username, user_id)',
+    # Последний дроп и дроп конкретного появления
+    'CREATE INDEX IF NOT EXISTS idx_boss_loot_created_at ON boss_loot (created_at)',
+    'CREATE INDEX IF NOT EXISTS idx_boss_loot_boss_kill_id ON boss_loot (boss_kill_id)',
+    # Число выпадений каждого предмета (покрывающий индекс) и дроп предмета за период
+    'CREATE INDEX IF NOT EXISTS idx_loot_items_item_created_at ON loot_items (item, created_at)',
+    # Дроп за период
+    'CREATE INDEX IF NOT EXISTS idx_loot_items_created_at ON loot_items (created_at)',
+    # Заполнение loot_items по старым записям boss_loot
+    'CREATE INDEX IF NOT EXISTS idx_loot_items_loot_id ON loot_items (loot_id)',
+    # Перенос дропа появления в архив
+    'CREATE INDEX IF NOT EXISTS idx_loot_items_boss_kill_id ON loot_items (boss_kill_id)',
+]
+
+# Полнотекстовый индекс по названиям предметов. Внешнее содержимое (content=):
+# текст хранится только в loot_items, индекс поддерживается триггерами
+LOOT_ITEMS_FTS_SQL = '''
+    CREATE VIRTUAL TABLE IF NOT EXISTS loot_items_fts USING fts5(item, content='loot_items', content_rowid='id')
+'''
+
+LOOT_ITEMS_FTS_TRIGGERS = [
+    '''
+    CREATE TRIGGER IF NOT EXISTS trg_loot_items_fts_insert AFTER INSERT ON loot_items
+    BEGIN
+        INSERT INTO loot_items_fts (rowid, item) VALUES (new.id, new.item);
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS trg_loot_items_fts_delete AFTER DELETE ON loot_items
+    BEGIN
+        INSERT INTO loot_items_fts (loot_items_fts, rowid, item) VALUES ('delete', old.id, old.item);
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS trg_loot_items_fts_update AFTER UPDATE OF item ON loot_items
+    BEGIN
+        INSERT INTO loot_items_fts (loot_items_fts, rowid, item) VALUES ('delete', old.id, old.item);
+        INSERT INTO loot_items_fts (rowid, item) VALUES (new.id, new.item);
+    END
+    ''',
+]
+
+# Записей boss_loot за одну транзакцию при заполнении loot_items
+LOOT_BACKFILL_BATCH = 500
+
+INSERT_LOOT_ITEM_SQL = '''
+    INSERT INTO loot_items (loot_id, boss_kill_id, user_id, username, item, created_at) VALUES (?, ?, ?, ?, ?, ?)
+'''
+
+# Поиск дропа по названию предмета (запрос FTS5) за период [начало, конец), вместе с архивом:
+# у архива свой индекс loot_items_fts (см. archive_schema_missing). Параметры: запрос,
+# начало и конец — по разу для рабочей базы и для архива, затем лимит
+LOOT_SEARCH_SQL = '''
+    SELECT item, username, created_at, boss_name
+    FROM (
+        SELECT li.item, li.username, li.created_at, bk.boss_name
+        FROM main.loot_items_fts f
+        JOIN main.loot_items li ON li.id = f.rowid
+        LEFT JOIN main.boss_kills bk ON bk.id = li.boss_kill_id
+        WHERE f.loot_items_fts MATCH ?
+        AND li.created_at >= ? AND li.created_at < ?
+        UNION ALL
+        SELECT li.item, li.username, li.created_at, bk.boss_name
+        FROM archive.loot_items_fts f
+        JOIN archive.loot_items li ON li.id = f.rowid
+        LEFT JOIN archive.boss_kills bk ON bk.id = li.boss_kill_id
+        WHERE f.loot_items_fts MATCH ?
+        AND li.created_at >= ? AND li.created_at < ?
+    )
+    ORDER BY created_at DESC
+    LIMIT ?
+'''
+
+# Сколько раз выпадал каждый предмет за период [начало, конец), вместе с архивом
+ITEM_DROP_COUNTS_SQL = '''
+    SELECT item, COUNT(*) as drop_count, MAX(created_at) as last_drop
+    FROM all_loot_items
+    WHERE created_at >= ? AND created_at < ?
+    GROUP BY item
+    ORDER BY drop_count DESC
+    LIMIT ?
+'''
+
+# Все распознанные предметы с числом выпадений (кандидаты в каталог предметов: manage.py items)
+RECOGNIZED_ITEMS_SQL = 'SELECT item, COUNT(*) FROM all_loot_items GROUP BY item'
+
+# Имена боссов по возрастанию: прыжками по индексу (boss_name, id), а не
+# DISTINCT или GROUP BY по всей истории — по поиску в индексе на босса
+BOSS_NAMES_CTE = '''
+    WITH RECURSIVE bosses (boss_name) AS (
+        SELECT MIN(boss_name) FROM boss_kills
+        UNION ALL
+        SELECT (SELECT MIN(boss_name) FROM boss_kills WHERE boss_name > bosses.boss_name)
+        FROM bosses WHERE boss_name IS NOT NULL
+    )
+'''
+
+# Последняя запись каждого босса: из них при старте строится SpawnIndex
+LATEST_SPAWNS_SQL = f'''
+    {BOSS_NAMES_CTE}
+    SELECT bk.*
+    FROM bosses
+    JOIN boss_kills bk ON bk.id = (SELECT MAX(id) FROM boss_kills WHERE boss_name = bosses.boss_name)
+'''
+
+SPAWN_BY_MESSAGE_SQL = 'SELECT id FROM boss_kills WHERE message_id = ?'
+
+CLOSE_OPEN_SPAWNS_SQL = 'UPDATE boss_kills SET is_killed = 1, respawn_notified = 1 WHERE boss_name = ? AND is_killed = 0'
+
+# Отметка участия одним запросом: уникальный индекс (boss_kill_id, user_id) не даёт
+# появиться дублю даже при двух одновременных реакциях
+UPSERT_ATTENDANCE_SQL = '''
+    INSERT INTO boss_attendance (boss_kill_id, user_id, username, attended) VALUES (?, ?, ?, ?)
+    ON CONFLICT (boss_kill_id, user_id) DO UPDATE SET attended = excluded.attended, username = excluded.username
+'''
+
+SET_ATTENDED_SQL = 'UPDATE boss_attendance SET attended = ? WHERE boss_kill_id = ? AND user_id = ?'
+
+UPCOMING_SPAWNS_SQL = '''
+    SELECT boss_name, respawn
+    FROM boss_kills
+    WHERE respawn > ? AND respawn < ?
+    ORDER BY respawn ASC
+'''
+
+# Топ боссов за всё время: из счётчиков boss_kill_counts, по индексу kill_count
+TOP_BOSSES_SQL = '''
+    SELECT boss_name, kill_count
+    FROM boss_kill_counts
+    WHERE kill_count > 0
+    ORDER BY kill_count DESC
+    LIMIT 10
+'''
+
+# Страница админа: боссы и игроки для форм
+ADMIN_BOSSES_SQL = f'''
+    {BOSS_NAMES_CTE}
+    SELECT boss_name FROM bosses WHERE boss_name IS NOT NULL
+'''
+
+# Проход по всему покрывающему индексу (username, user_id) без сортировки и временной
+# таблицы для DISTINCT; отметки старше ARCHIVE_AFTER_DAYS лежат в архиве, поэтому индекс
+# не растёт с историей. Разрешённый полный просмотр в manage.py explain
+ADMIN_MEMBERS_SQL = 'SELECT DISTINCT user_id, username FROM boss_attendance ORDER BY username'
+
+RECENT_LOOT_SQL = '''
+    SELECT bl.*, bk.boss_name, bk.kill_time
+    FROM boss_loot bl
+    JOIN boss_kills bk ON bl.boss_kill_id = bk.id
+    ORDER BY bl.created_at DESC
+    LIMIT 50
+'''
+
+# Сводка участия: число отметок по дню (местная дата kill_time), игроку и боссу.
+# Поддерживается триггерами в той же транзакции, что и изменение отметки;
+# DELETE из boss_attendance сводку не меняет (архив старых отметок её не трогает).
+# Пересчёт с нуля: python manage.py rebuild-rollups
+ATTENDANCE_DAILY_TABLE_SQL = '''
+    CREATE TABLE IF NOT EXISTS attendance_daily (
+        day TEXT NOT NULL,
+        user_id INTEGER NOT NULL,
+        boss_name TEXT NOT NULL,
+        username TEXT,
+        attendance_count INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (day, user_id, boss_name)
+    ) WITHOUT ROWID
+'''
+
+# День появления; у появлений без kill_time (нераспознанные старые даты) — пустая строка
+ROLLUP_DAY = "COALESCE(date(bk.kill_time, 'unixepoch', 'localtime'), '')"
+
+ROLLUP_TRIGGERS = [
+    f'''
+    CREATE TRIGGER IF NOT EXISTS trg_attendance_daily_insert
+    AFTER INSERT ON boss_attendance WHEN new.attended = 1
+    BEGIN
+        INSERT INTO attendance_daily (day, user_id, boss_name, username, attendance_count)
+        SELECT {ROLLUP_DAY}, new.user_id, COALESCE(bk.boss_name, ''), new.username, 1
+        FROM boss_kills bk WHERE bk.id = new.boss_kill_id
+        ON CONFLICT (day, user_id, boss_name) DO UPDATE
+        SET attendance_count = attendance_count + 1, username = excluded.username;
+    END
+    ''',
+    f'''
+    CREATE TRIGGER IF NOT EXISTS trg_attendance_daily_update
+    AFTER UPDATE OF attended ON boss_attendance WHEN new.attended IS NOT old.attended
+    BEGIN
+        INSERT INTO attendance_daily (day, user_id, boss_name, username, attendance_count)
+        SELECT {ROLLUP_DAY}, new.user_id, COALESCE(bk.boss_name, ''), new.username,
+               CASE WHEN new.attended = 1 THEN 1 ELSE -1 END
+        FROM boss_kills bk WHERE bk.id = new.boss_kill_id
+        ON CONFLICT (day, user_id, boss_name) DO UPDATE
+        SET attendance_count = attendance_count + excluded.attendance_count, username = excluded.username;
+    END
+    ''',
+]
+
+# Строки сводки, посчитанные прямо по отметкам (вместе с архивом)
+ROLLUP_COUNTS_SQL = f'''
+    SELECT {ROLLUP_DAY}, ba.user_id, COALESCE(bk.boss_name, ''), MAX(ba.username), COUNT(*)
+    FROM all_boss_attendance ba
+    JOIN all_boss_kills bk ON ba.boss_kill_id = bk.id
+    WHERE ba.attended = 1
+    GROUP BY 1, ba.user_id, 3
+'''
+
+REBUILD_ROLLUP_SQL = f'''
+    INSERT INTO attendance_daily (day, user_id, boss_name, username, attendance_count)
+    {ROLLUP_COUNTS_SQL}
+'''
+
+# Участие игроков за всё время: одна строка на игрока, для топа без границ периода.
+# Ведётся так же, как attendance_daily: триггеры на boss_attendance, DELETE не меняет
+ATTENDANCE_TOTALS_TABLE_SQL = '''
+    CREATE TABLE IF NOT EXISTS attendance_totals (
+        user_id INTEGER NOT NULL PRIMARY KEY,
+        username TEXT,
+        attendance_count INTEGER NOT NULL DEFAULT 0
+    )
+'''
+
+ATTENDANCE_TOTALS_INDEX_SQL = ('CREATE INDEX IF NOT EXISTS idx_attendance_totals_attendance_count '
+                               'ON attendance_totals (attendance_count)')
+
+ATTENDANCE_TOTALS_TRIGGERS = [
+    '''
+    CREATE TRIGGER IF NOT EXISTS trg_attendance_totals_insert
+    AFTER INSERT ON boss_attendance WHEN new.attended = 1
+    BEGIN
+        INSERT INTO attendance_totals (user_id, username, attendance_count) VALUES (new.user_id, new.username, 1)
+        ON CONFLICT (user_id) DO UPDATE
+        SET attendance_count = attendance_count + 1, username = excluded.username;
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS trg_attendance_totals_update
+    AFTER UPDATE OF attended ON boss_attendance WHEN new.attended IS NOT old.attended
+    BEGIN
+        INSERT INTO attendance_totals (user_id, username, attendance_count)
+        VALUES (new.user_id, new.username, CASE WHEN new.attended = 1 THEN 1 ELSE -1 END)
+        ON CONFLICT (user_id) DO UPDATE
+        SET attendance_count = attendance_count + excluded.attendance_count, username = excluded.username;
+    END
+    ''',
+]
+
+# Итоги по игрокам, посчитанные прямо по отметкам (вместе с архивом)
+ATTENDANCE_TOTALS_SQL = '''
+    SELECT user_id, MAX(username), COUNT(*)
+    FROM all_boss_attendance
+    WHERE attended = 1
+    GROUP BY user_id
+'''
+
+# Число убийств (is_killed = 1) по боссу за всё время. Как и attendance_daily,
+# поддерживается триггерами в транзакции изменения boss_kills, а DELETE (перенос
+# в архив) счётчики не меняет. Пересчёт с нуля: python manage.py rebuild-rollups
+BOSS_KILL_COUNTS_TABLE_SQL = '''
+    CREATE TABLE IF NOT EXISTS boss_kill_counts (
+        boss_name TEXT NOT NULL PRIMARY KEY,
+        kill_count INTEGER NOT NULL DEFAULT 0
+    ) WITHOUT ROWID
+'''
+
+BOSS_KILL_COUNTS_INDEX_SQL = 'CREATE INDEX IF NOT EXISTS idx_boss_kill_counts_kill_count ON boss_kill_counts (kill_count)'
+
+BOSS_KILL_COUNTS_TRIGGERS = [
+    '''
+    CREATE TRIGGER IF NOT EXISTS trg_boss_kill_counts_insert
+    AFTER INSERT ON boss_kills WHEN new.is_killed = 1
+    BEGIN
+        INSERT INTO boss_kill_counts (boss_name, kill_count) VALUES (COALESCE(new.boss_name, ''), 1)
+        ON CONFLICT (boss_name) DO UPDATE SET kill_count = kill_count + 1;
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS trg_boss_kill_counts_update
+    AFTER UPDATE OF is_killed ON boss_kills WHEN (new.is_killed = 1) IS NOT (old.is_killed = 1)
+    BEGIN
+        INSERT INTO boss_kill_counts (boss_name, kill_count)
+        VALUES (COALESCE(new.boss_name, ''), CASE WHEN new.is_killed = 1 THEN 1 ELSE -1 END)
+        ON CONFLICT (boss_name) DO UPDATE SET kill_count = kill_count + excluded.kill_count;
+    END
+    ''',
+]
+
+# Счётчики, посчитанные прямо по появлениям (вместе с архивом)
+BOSS_KILL_COUNTS_SQL = '''
+    SELECT COALESCE(boss_name, ''), COUNT(*)
+    FROM all_boss_kills
+    WHERE is_killed = 1
+    GROUP BY 1
+'''
+
+# Топ игроков за всё время: строк в attendance_totals столько, сколько игроков
+LEADERBOARD_ALL_TIME_SQL = '''
+    SELECT username, attendance_count
+    FROM attendance_totals
+    WHERE attendance_count > 0
+    ORDER BY attendance_count DESC
+    LIMIT ?
+'''
+
+# Отметки за отрезок [начало, конец) по одной схеме (main или archive).
+# CROSS JOIN фиксирует порядок таблиц в SQLite: сначала диапазон по индексу
+# kill_time, затем отметки по индексу (boss_kill_id, user_id)
+EDGE_ATTENDANCE_SQL = '''
+        SELECT ba.user_id, ba.username, 1
+        FROM {schema}.boss_kills bk
+        CROSS JOIN {schema}.boss_attendance ba ON ba.boss_kill_id = bk.id
+        WHERE ba.attended = 1
+        AND bk.kill_time >= ? AND bk.kill_time < ?
+'''
+
+# Участие игроков за период [начало, конец): полные дни — из сводки, неполные
+# первый и последний день — из отметок рабочей базы и архива: при ARCHIVE_AFTER_DAYS
+# меньше периода часть отметок края уже в архиве (параметры считает leaderboard_params)
+LEADERBOARD_SQL = f'''
+    SELECT username, SUM(attendance_count) as attendance_count
+    FROM (
+        SELECT user_id, username, attendance_count
+        FROM attendance_daily
+        WHERE day >= ? AND day < ?
+        UNION ALL
+        {EDGE_ATTENDANCE_SQL.format(schema='main')}
+        UNION ALL
+        {EDGE_ATTENDANCE_SQL.format(schema='archive')}
+        UNION ALL
+        {EDGE_ATTENDANCE_SQL.format(schema='main')}
+        UNION ALL
+        {EDGE_ATTENDANCE_SQL.format(schema='archive')}
+    )
+    GROUP BY user_id
+    HAVING SUM(attendance_count) > 0
+    ORDER BY attendance_count DESC
+    LIMIT ?
+'''
+
+# Верхняя граница дней сводки для периода без конца
+LAST_DAY = '9999-12-31'
+
+
+def leaderboard_query(start=None, end=None, limit=-1):
+    """Запрос топа игроков и его параметры для периода [start, end) в datetime; None — без границы.
+
+    Период без обеих границ читается из attendance_totals, остальные — из
+    attendance_daily: строк сводки столько, сколько дней в периоде, а не в истории.
+    """
+    if start is None and end is None:
+        return LEADERBOARD_ALL_TIME_SQL, (limit,)
+    return LEADERBOARD_SQL, leaderboard_params(start, end, limit)
+
+
+def leaderboard_params(start=None, end=None, limit=-1):
+    """Параметры LEADERBOARD_SQL для периода [start, end) в datetime; None — без границы"""
+    if start is None:
+        first_full = ''
+        head = (0, 0)
+    else:
+        midnight = start.replace(hour=0, minute=0, second=0, microsecond=0)
+        first_full_start = start if start == midnight else midnight + timedelta(days=1)
+        if end is not None and end < first_full_start:
+            first_full_start = end
+        first_full = first_full_start.strftime('%Y-%m-%d')
+        head = (to_epoch(start), to_epoch(first_full_start))
+
+    if end is None:
+        last_day = LAST_DAY
+        tail = (0, 0)
+    else:
+        end_midnight = end.replace(hour=0, minute=0, second=0, microsecond=0)
+        if start is not None:
+            end_midnight = max(end_midnight, first_full_start)
+        last_day = end_midnight.strftime('%Y-%m-%d')
+        tail = (to_epoch(end_midnight), to_epoch(end))
+
+    return (first_full, last_day) + head * 2 + tail * 2 + (limit,)
+
+
+def split_loot_text(loot_text):
+    """Предметы из boss_loot.loot_text (по одному в строке)"""
+    if not loot_text or loot_text == LOOT_NOT_RECOGNIZED:
+        return []
+    return [' '.join(line.split()) for line in loot_text.split('\n') if line.strip()]
+
+
+def begin_immediate(conn, attempts=DB_LOCK_ATTEMPTS):
+    """BEGIN IMMEDIATE с ожиданием до attempts раз по DB_BUSY_TIMEOUT_MS: блокировку может
+    держать миграция или раскладка дропа в другом процессе. После последней попытки
+    ошибка «database is locked» пробрасывается вызывающему"""
+    start = time.perf_counter()
+    for attempt in range(1, attempts + 1):
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            return
+        except sqlite3.OperationalError as e:
+            if 'locked' not in str(e) or attempt == attempts:
+                raise
+            logger.warning(f"База занята другим процессом уже {time.perf_counter() - start:.1f} с, "
+                           f"ждём освобождения блокировки (попытка {attempt + 1} из {attempts})")
+
+
+def backfill_loot_items(conn, batch_size=LOOT_BACKFILL_BATCH):
+    """Раскладывает loot_text записей boss_loot без строк в loot_items, по batch_size записей за транзакцию.
+
+    Повторный запуск безопасен: записи, у которых предметы уже есть, пропускаются.
+    Проверка «предметов ещё нет» и вставка идут под одной блокировкой записи
+    (BEGIN IMMEDIATE), поэтому два одновременных запуска не раскладывают одну
+    запись дважды. Если транзакция уже открыта вызывающим, всё выполняется в
+    ней, без промежуточных фиксаций.
+    Возвращает (просмотрено записей, добавлено предметов).
+    """
+    cursor = conn.cursor()
+    own_transactions = not conn.in_transaction
+    last_id = 0
+    loots = items = 0
+    while True:
+        if own_transactions:
+            begin_immediate(conn)
+        rows = cursor.execute('''
+            SELECT bl.id, bl.boss_kill_id, bl.user_id, bl.username, bl.loot_text, bl.created_at
+            FROM boss_loot bl
+            WHERE bl.id > ? AND NOT EXISTS (SELECT 1 FROM loot_items li WHERE li.loot_id = bl.id)
+            ORDER BY bl.id
+            LIMIT ?
+        ''', (last_id, batch_size)).fetchall()
+        if not rows:
+            if own_transactions:
+                conn.rollback()
+            break
+        batch = [
+            (row['id'], row['boss_kill_id'], row['user_id'], row['username'], item,
+             parse_legacy_time(row['created_at']))
+            for row in rows
+            for item in split_loot_text(row['loot_text'])
+        ]
+        try:
+            cursor.executemany(INSERT_LOOT_ITEM_SQL, batch)
+        except Exception:
+            if own_transactions:
+                conn.rollback()
+            raise
+        if own_transactions:
+            conn.commit()
+        last_id = rows[-1]['id']
+        loots += len(rows)
+        items += len(batch)
+    return loots, items
+
+
+def rebuild_attendance_rollup(cursor):
+    """Пересчитывает attendance_daily по всем отметкам (в транзакции вызывающего)"""
+    cursor.execute('DELETE FROM attendance_daily')
+    cursor.execute(REBUILD_ROLLUP_SQL)
+    return cursor.rowcount
+
+
+def rebuild_attendance_totals(cursor):
+    """Пересчитывает attendance_totals по всем отметкам (в транзакции вызывающего)"""
+    cursor.execute('DELETE FROM attendance_totals')
+    cursor.execute(f'INSERT INTO attendance_totals (user_id, username, attendance_count) {ATTENDANCE_TOTALS_SQL}')
+    return cursor.rowcount
+
+
+def rebuild_boss_kill_counts(cursor):
+    """Пересчитывает boss_kill_counts по всем появлениям (в транзакции вызывающего)"""
+    cursor.execute('DELETE FROM boss_kill_counts')
+    cursor.execute(f'INSERT INTO boss_kill_counts (boss_name, kill_count) {BOSS_KILL_COUNTS_SQL}')
+    return cursor.rowcount
+
+
+def archive_path(path):
+    """Архив рабочей базы path: ARCHIVE_DB_PATH для основной, рядом с файлом — для остальных"""
+    if path == DB_PATH:
+        return ARCHIVE_DB_PATH
+    if path == ':memory:':
+        return path
+    return os.path.splitext(path)[0] + '_archive.db'
+
+
+def attach_archive(conn, path):
+    """Подключает архив как схему archive и создаёт представления all_* для статистики за всё время"""
+    conn.execute('ATTACH DATABASE ? AS archive', (path,))
+    conn.execute('PRAGMA archive.journal_mode = WAL')
+    # Схема архива создаётся, только если её ещё нет: CREATE ... IF NOT EXISTS тоже ждёт
+    # блокировку записи, а её надолго держит миграция в другом процессе
+    # (BEGIN IMMEDIATE блокирует и подключённый архив)
+    if archive_schema_missing(conn):
+        begin_immediate(conn)
+        for statement in archive_schema_missing(conn):
+            conn.execute(statement)
+        conn.commit()
+    create_archive_views(conn)
 
-def get_db_connection():
-    conn = sqlite3.connect('crp_clan.db')
-    conn.row_factory = sqlite3.Row
-    return conn
 
+def archive_schema_missing(conn):
+    """Запросы для таблиц, индексов и поиска по предметам, которых ещё нет в архиве.
 
-def migrate_database():
-    conn = get_db_connection()
-    cursor = conn.cursor()
+    У архива свой полнотекстовый индекс loot_items_fts с теми же триггерами,
+    что и в рабочей базе: перенесённые предметы индексируются при вставке в
+    архив. Индекс, созданный для уже заполненного архива, строится заново (rebuild).
+    """
+    existing = {row[0] for row in conn.execute('SELECT name FROM archive.sqlite_master')}
+    statements = [f'CREATE TABLE IF NOT EXISTS archive.{table} ({TABLES[table]})'
+                  for table in ARCHIVE_TABLES if table not in existing]
+    for statement in INDEXES + [LOOT_ITEMS_FTS_SQL] + LOOT_ITEMS_FTS_TRIGGERS:
+        if statement.split('IF NOT EXISTS ')[1].split()[0] not in existing:
+            statements.append(statement.replace('IF NOT EXISTS ', 'IF NOT EXISTS archive.', 1))
+    if 'loot_items_fts' not in existing:
+        statements.append("INSERT INTO archive.loot_items_fts (loot_items_fts) VALUES ('rebuild')")
+    return statements
 
-    # Миграция формата дат
-    # ИСПРАВЛЕНИЕ: Убрали попытку выбрать created_at из boss_kills
-    cursor.execute("SELECT id, kill_time, respawn FROM boss_kills")  # Убрали created_at
-    boss_kills = cursor.fetchall()
 
-    for boss in boss_kills:
-        try:
-            # Преобразуем старый формат дат в новый ISO формат
-            if boss['kill_time'] and '.' in boss['kill_time'] and '-' in boss['kill_time']:
-                day, month, year_time = boss['kill_time'].split('.')
-                year, time = year_time.split('-')
-                new_kill_time = f"20{year}-{month}-{day} {time}:00"
+def create_archive_views(conn):
+    for view, table in ARCHIVE_VIEWS.items():
+        columns = ', '.join(row['name'] for row in conn.execute(f'PRAGMA archive.table_info({table})'))
+        conn.execute(f'CREATE TEMP VIEW IF NOT EXISTS {view} AS '
+                     f'SELECT {columns} FROM main.{table} UNION ALL SELECT {columns} FROM archive.{table}')
 
-                cursor.execute("UPDATE boss_kills SET kill_time = ? WHERE id = ?",
-                               (new_kill_time, boss['id']))
-        except:
-            pass
 
-        try:
-            if boss['respawn'] and '.' in boss['respawn'] and '-' in boss['respawn']:
-                day, month, year_time = boss['respawn'].split('.')
-                year, time = year_time.split('-')
-                new_respawn = f"20{year}-{month}-{day} {time}:00"
+def connect(path=DB_PATH):
+    """Новое соединение с настройками для одновременной работы бота и сайта"""
+    conn = sqlite3.connect(path, timeout=DB_BUSY_TIMEOUT_MS / 1000)
+    conn.row_factory = sqlite3.Row
+    # Для новой (пустой) базы: место после архивации возвращается PRAGMA incremental_vacuum.
+    # У существующей режим уже записан в файле, а сама установка ждёт блокировку
+    # записи — connect() не должен ждать миграцию в другом процессе
+    if conn.execute('PRAGMA page_count').fetchone()[0] == 0:
+        conn.execute('PRAGMA auto_vacuum = INCREMENTAL')
+    # WAL: читатели не блокируют писателя и наоборот; NORMAL в WAL не теряет целостность при сбое
+    conn.execute('PRAGMA journal_mode = WAL')
+    conn.execute('PRAGMA synchronous = NORMAL')
+    conn.execute(f'PRAGMA busy_timeout = {DB_BUSY_TIMEOUT_MS}')
+    conn.execute(f'PRAGMA cache_size = -{DB_CACHE_MB * 1024}')
+    conn.execute(f'PRAGMA mmap_size = {DB_MMAP_MB * 1024 * 1024}')
+    conn.execute('PRAGMA temp_store = MEMORY')
+    attach_archive(conn, archive_path(path))
+    return conn
 
-                cursor.execute("UPDATE boss_kills SET respawn = ? WHERE id = ?",
-                               (new_respawn, boss['id']))
-        except:
-            pass
 
-    # ИСПРАВЛЕНИЕ: Теперь выбираем created_at только из boss_loot
-    cursor.execute("SELECT id, created_at FROM boss_loot")
-    loots = cursor.fetchall()
+def get_db_connection():
+    """Соединение текущего потока: создаётся один раз и переиспользуется, закрывать его не нужно.
+
+    Изменения оборачиваются в `with conn:` — транзакция фиксируется или
+    откатывается целиком и не остаётся открытой на общем соединении.
+    """
+    conn = getattr(_local, 'conn', None)
+    if conn is None:
+        conn = _local.conn = connect()
+    return conn
 
-    for loot in loots:
-        try:
-            if loot['created_at'] and '.' in loot['created_at'] and '-' in loot['created_at']:
-                day, month, year_time = loot['created_at'].split('.')
-                year, time = year_time.split('-')
-                new_created_at = f"20{year}-{month}-{day} {time}:00"
 
-                cursor.execute("UPDATE boss_loot SET created_at = ? WHERE id = ?",
-                               (new_created_at, loot['id']))
-        except:
-            pass
+def close_db_connection():
+    """Закрывает соединение текущего потока (при остановке)"""
+    conn = getattr(_local, 'conn', None)
+    if conn is not None:
+        _local.conn = None
+        conn.close()
 
-    conn.commit()
-    conn.close()
 
+def to_epoch(moment):
+    """datetime (местное время бота) в секунды Unix для столбцов времени"""
+    return int(moment.timestamp())
 
-def init_db():
-    conn = get_db_connection()
-    cursor = conn.cursor()
 
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS boss_kills (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            boss_name TEXT,
-            kill_time TEXT,
-            respawn TEXT,
-            message_id INTEGER,
-            channel_id INTEGER,
-            is_killed INTEGER DEFAULT 0,
-            respawn_notified INTEGER DEFAULT 0
-        )
-    ''')
-
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS boss_attendance (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            boss_kill_id INTEGER,
-            user_id INTEGER,
-            username TEXT,
-            attended INTEGER DEFAULT 0,
-            FOREIGN KEY (boss_kill_id) REFERENCES boss_kills (id)
-        )
-    ''')
-
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS boss_loot (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            boss_kill_id INTEGER,
-            user_id INTEGER,
-            username TEXT,
-            screenshot_path TEXT,
-            loot_text TEXT,
-            created_at TEXT,
-            FOREIGN KEY (boss_kill_id) REFERENCES boss_kills (id)
-        )
-    ''')
-
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS web_users (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            discord_id INTEGER UNIQUE,
-            username TEXT,
-            is_admin INTEGER DEFAULT 0,
-            created_at TEXT
-        )
-    ''')
+def format_time(epoch):
+    """Секунды Unix из базы в строку для страниц сайта"""
+    if epoch is None:
+        return ''
+    return datetime.fromtimestamp(epoch).strftime(TIME_FORMAT)
+
 
-    conn.commit()
-    conn.close()
-    migrate_database()
+def parse_legacy_time(value):
+    """Текстовая дата любого из старых форматов в секунды Unix; None, если не распознана"""
+    if value is None or isinstance(value, int):
+        return value
+    for time_format in LEGACY_TIME_FORMATS:
+        try:
+            return to_epoch(datetime.strptime(value.strip(), time_format))
+        except ValueError:
+            continue
+    return None
 
 
 def insert_test_data():
@@ -130,12 +696,12 @@ def insert_test_data():
         now = datetime.now()
 
         test_bosses = [
-            ('Venatus - 60 LV', (now - timedelta(hours=2)).strftime("%Y-%m-%d %H:%M"),
-             (now + timedelta(hours=8)).strftime("%Y-%m-%d %H:%M"), 1, 0, 123456789),
-            ('Ego - 70 LV', (now - timedelta(days=1)).strftime("%Y-%m-%d %H:%M"),
-             (now + timedelta(hours=20)).strftime("%Y-%m-%d %H:%M"), 1, 0, 123456790),
-            ('Livera - 75 LV', (now - timedelta(days=2)).strftime("%Y-%m-%d %H:%M"),
-             (now + timedelta(hours=22)).strftime("%Y-%m-%d %H:%M"), 1, 0, 123456791)
+            ('Venatus - 60 LV', to_epoch(now - timedelta(hours=2)),
+             to_epoch(now + timedelta(hours=8)), 1, 0, 123456789),
+            ('Ego - 70 LV', to_epoch(now - timedelta(days=1)),
+             to_epoch(now + timedelta(hours=20)), 1, 0, 123456790),
+            ('Livera - 75 LV', to_epoch(now - timedelta(days=2)),
+             to_epoch(now + timedelta(hours=22)), 1, 0, 123456791)
         ]
 
         cursor.executemany(
@@ -163,10 +729,10 @@ def insert_test_data():
 
         # Добавляем тестовый дроп
         test_loot = [
-            (boss_ids[0], 1, 'Player1', '/path/to/screenshot1.png', 'Epic Sword, Rare Shield',
-             now.strftime("%Y-%m-%d %H:%M")),
-            (boss_ids[1], 2, 'Player2', '/path/to/screenshot2.png', 'Legendary Armor, Epic Helmet',
-             (now - timedelta(hours=5)).strftime("%Y-%m-%d %H:%M"))
+            (boss_ids[0], 1, 'Player1', '/path/to/screenshot1.png', 'Epic Sword\nRare Shield',
+             to_epoch(now)),
+            (boss_ids[1], 2, 'Player2', '/path/to/screenshot2.png', 'Legendary Armor\nEpic Helmet',
+             to_epoch(now - timedelta(hours=5)))
         ]
 
         cursor.executemany(
@@ -175,9 +741,8 @@ def insert_test_data():
         )
 
         conn.commit()
+        backfill_loot_items(conn)
         logger.info("Тестовые данные успешно добавлены в базу")
     except Exception as e:
         logger.error(f"Ошибка при добавлении тестовых данных: {e}")
-        conn.rollback()
-    finally:
-        conn.close()
\ No newline at end of file
+        conn.rollback()
\ No newline at end of file
@@ -0,0 +1,126 @@
+import datetime
+import itertools
+import logging
+import os
+import queue
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+MODES = ('off', 'all', 'sample', 'failures')
+
+
+class DebugSession:
+    """Отладочные материалы одного скриншота.
+
+    Пока идёт распознавание, здесь только ссылки на изображения и текст —
+    кодирование в PNG и запись на диск происходят в фоне и только если
+    DebugCapture решит сохранить этот скриншот.
+    """
+
+    def __init__(self, enabled):
+        self.enabled = enabled
+        self.artefacts = []
+
+    def add_image(self, name, image):
+        if self.enabled:
+            self.artefacts.append((name, image))
+
+    def add_text(self, name, text):
+        if self.enabled:
+            self.artefacts.append((name, text))
+
+
+class DebugCapture:
+    """Сохранение отладочных изображений в фоновом потоке с ограничением объёма.
+
+    Режимы: off — ничего не сохраняется, all — каждый скриншот,
+    sample — каждый N-й, failures — только если предметы не распознаны.
+    В папке хранится не больше max_files файлов, max_bytes байт и файлов
+    не старше max_age секунд: самые старые удаляются.
+    """
+
+    def __init__(self, directory, mode='off', sample_every=10, max_files=200,
+                 max_bytes=200 * 1024 * 1024, max_age=72 * 3600, queue_size=16):
+        if mode not in MODES:
+            logger.error(f"Неизвестный режим отладки '{mode}', отладка выключена")
+            mode = 'off'
+        self.directory = directory
+        self.mode = mode
+        self.sample_every = max(1, sample_every)
+        self.max_files = max_files
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self._counter = itertools.count()
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._thread = None
+
+    def session(self):
+        """Новый набор материалов; в режиме sample решение принимается сразу"""
+        if self.mode == 'off':
+            return DebugSession(False)
+        if self.mode == 'sample':
+            return DebugSession(next(self._counter) % self.sample_every == 0)
+        return DebugSession(True)
+
+    def finish(self, session, failed):
+        """Отправляет материалы на запись, если их нужно сохранить"""
+        if not session.enabled or not session.artefacts:
+            return
+        if self.mode == 'failures' and not failed:
+            return
+
+        self._ensure_writer()
+        try:
+            self._queue.put_nowait(session.artefacts)
+        except queue.Full:
+            logger.warning("Очередь отладочных изображений переполнена, материалы пропущены")
+
+    def _ensure_writer(self):
+        if self._thread is None:
+            os.makedirs(self.directory, exist_ok=True)
+            self._thread = threading.Thread(target=self._writer, name='debug-capture', daemon=True)
+            self._thread.start()
+
+    def _writer(self):
+        while True:
+            artefacts = self._queue.get()
+            prefix = f"{datetime.datetime.now().strftime('%Y%m%d_%H%M%S_%f')}"
+            for name, artefact in artefacts:
+                try:
+                    if isinstance(artefact, str):
+                        path = os.path.join(self.directory, f"{prefix}_{name}.txt")
+                        with open(path, 'w', encoding='utf-8') as f:
+                            f.write(artefact)
+                    else:
+                        path = os.path.join(self.directory, f"{prefix}_{name}.png")
+                        artefact.save(path, 'PNG')
+                    logger.info(f"Сохранён отладочный файл: {path}")
+                except Exception as e:
+                    logger.error(f"Ошибка при сохранении отладочного файла {name}: {e}")
+            self.enforce_limits()
+
+    def enforce_limits(self):
+        """Удаляет самые старые файлы сверх лимитов по количеству, объёму и возрасту"""
+        try:
+            entries = []
+            with os.scandir(self.directory) as it:
+                for entry in it:
+                    if entry.is_file():
+                        stat = entry.stat()
+                        entries.append((stat.st_mtime, stat.st_size, entry.path))
+        except FileNotFoundError:
+            return
+
+        entries.sort(reverse=True)  # новые первыми
+        now = time.time()
+        total_bytes = 0
+        for index, (mtime, size, path) in enumerate(entries):
+            total_bytes += size
+            if (index >= self.max_files or total_bytes > self.max_bytes
+                    or now - mtime > self.max_age):
+                try:
+                    os.remove(path)
+                except OSError as e:
+                    logger.error(f"Не удалось удалить отладочный файл {path}: {e}")
@@ -0,0 +1,202 @@
+import numpy as np
+from PIL import Image
+
+# Диапазоны цветов текста (H в градусах, S и V в процентах)
+HSV_TEXT_RANGES = [
+    ((0, 10), (50, 100), (30, 100)),  # красный 1
+    ((340, 360), (50, 100), (30, 100)),  # красный 2
+    ((80, 150), (30, 100), (30, 100)),  # зелёный
+    ((180, 260), (30, 100), (30, 100)),  # синий
+    ((260, 320), (30, 100), (30, 100)),  # фиолетовый
+    ((30, 70), (30, 100), (30, 100)),  # жёлтый
+    ((0, 360), (0, 20), (40, 100)),  # серый/белый обычный текст
+]
+
+# Сколько пикселей обрабатывается за раз в построчных полосах: временные
+# float64 массивы HSV занимают порядка 150 байт на пиксель полосы, поэтому
+# их объём ограничен константой (~40 МБ) независимо от размера изображения
+STRIP_PIXELS = 1 << 18
+
+
+def rgb_to_hsv_array(img_array):
+    """RGB → HSV для всего массива сразу.
+
+    Повторяет colorsys.rgb_to_hsv поэлементно (те же операции в том же порядке),
+    поэтому результат совпадает с попиксельным циклом бит в бит.
+    Возвращает H в градусах, S и V в процентах.
+    """
+    rgb = img_array[..., :3] / 255.0
+    r, g, b = rgb[..., 0], rgb[..., 1], rgb[..., 2]
+
+    maxc = np.maximum(np.maximum(r, g), b)
+    minc = np.minimum(np.minimum(r, g), b)
+    rangec = maxc - minc
+    gray = rangec == 0
+
+    # Для серых пикселей делим на 1, чтобы не получить nan; ниже они обнуляются
+    safe_max = np.where(maxc == 0, 1.0, maxc)
+    safe_range = np.where(gray, 1.0, rangec)
+
+    s = rangec / safe_max
+    rc = (maxc - r) / safe_range
+    gc = (maxc - g) / safe_range
+    bc = (maxc - b) / safe_range
+
+    h = np.where(r == maxc, bc - gc,
+                 np.where(g == maxc, 2.0 + rc - bc, 4.0 + gc - rc))
+    h = np.mod(h / 6.0, 1.0)
+
+    h[gray] = 0.0
+    s[gray] = 0.0
+
+    return np.stack([h * 360, s * 100, maxc * 100], axis=-1)
+
+
+def hsv_text_mask(hsv_array, ranges=HSV_TEXT_RANGES):
+    """Маска пикселей, попадающих хотя бы в один из цветовых диапазонов текста"""
+    h, s, v = hsv_array[..., 0], hsv_array[..., 1], hsv_array[..., 2]
+    text_mask = np.zeros(hsv_array.shape[:2], dtype=bool)
+    for h_range, s_range, v_range in ranges:
+        mask = ((h >= h_range[0]) & (h <= h_range[1]) &
+                (s >= s_range[0]) & (s <= s_range[1]) &
+                (v >= v_range[0]) & (v <= v_range[1]))
+        text_mask |= mask
+    return text_mask
+
+
+def _strip_rows(width, strip_pixels=STRIP_PIXELS):
+    return max(1, strip_pixels // max(1, width))
+
+
+def text_color_mask(img_array, ranges=HSV_TEXT_RANGES, strip_pixels=STRIP_PIXELS):
+    """Маска цветного текста для uint8 RGB массива, посчитанная полосами строк.
+
+    Результат совпадает с hsv_text_mask(rgb_to_hsv_array(...)), но полный
+    float64 HSV массив (24 байта на пиксель) никогда не создаётся.
+    """
+    height, width = img_array.shape[:2]
+    text_mask = np.empty((height, width), dtype=bool)
+    step = _strip_rows(width, strip_pixels)
+    for top in range(0, height, step):
+        strip = img_array[top:top + step]
+        text_mask[top:top + step] = hsv_text_mask(rgb_to_hsv_array(strip), ranges)
+    return text_mask
+
+
+def edge_row_profile(gray, edge_threshold=60, strip_pixels=STRIP_PIXELS):
+    """Доля резких горизонтальных перепадов яркости в каждой строке uint8 массива"""
+    height, width = gray.shape
+    profile = np.empty(height, dtype=np.float64)
+    step = _strip_rows(width, strip_pixels)
+    for top in range(0, height, step):
+        strip = gray[top:top + step].astype(np.int16)
+        profile[top:top + step] = (np.abs(np.diff(strip, axis=1)) > edge_threshold).mean(axis=1)
+    return profile
+
+
+def _runs(flags, max_gap):
+    """Отрезки подряд идущих True; разрывы не длиннее max_gap склеиваются"""
+    runs = []
+    start = None
+    gap = 0
+    for i, flag in enumerate(flags):
+        if flag:
+            if start is None:
+                start = i
+            gap = 0
+            end = i
+        elif start is not None:
+            gap += 1
+            if gap > max_gap:
+                runs.append((start, end + 1))
+                start = None
+    if start is not None:
+        runs.append((start, end + 1))
+    return runs
+
+
+def find_text_region(image, work_width=640, edge_threshold=60, row_density=0.015,
+                     col_density=0.02, padding=8, max_area=0.85):
+    """Ищет область с текстом (лог чата) по проекциям резких перепадов яркости.
+
+    Работает на уменьшенной копии: строки, где много резких горизонтальных
+    перепадов, — строки текста. Берётся самый высокий блок таких строк, внутри
+    него по проекции на столбцы находятся левая и правая границы.
+    Возвращает (left, top, right, bottom) в координатах исходного изображения
+    или None, если область не найдена или почти совпадает со всем кадром.
+    """
+    width, height = image.size
+    scale = min(1.0, work_width / width)
+    small = image.convert('L')
+    if scale < 1.0:
+        small = small.resize((max(1, int(width * scale)), max(1, int(height * scale))))
+    gray = np.asarray(small, dtype=np.int16)
+    if gray.shape[0] < 2 or gray.shape[1] < 2:
+        return None
+
+    edges = np.abs(np.diff(gray, axis=1)) > edge_threshold
+
+    # Строки текста и самый высокий блок из них (строки чата идут почти без разрывов)
+    row_profile = edges.mean(axis=1)
+    bands = _runs(row_profile >= row_density, max_gap=max(3, gray.shape[0] // 40))
+    if not bands:
+        return None
+    top, bottom = max(bands, key=lambda band: band[1] - band[0])
+
+    # Границы по столбцам внутри найденного блока
+    col_profile = edges[top:bottom].mean(axis=0)
+    columns = _runs(col_profile >= col_density, max_gap=max(4, gray.shape[1] // 20))
+    if not columns:
+        return None
+    left, right = columns[0][0], columns[-1][1]
+
+    box = (
+        max(0, int(left / scale) - padding),
+        max(0, int(top / scale) - padding),
+        min(width, int(right / scale) + padding),
+        min(height, int(bottom / scale) + padding),
+    )
+    area = (box[2] - box[0]) * (box[3] - box[1])
+    if area >= max_area * width * height:
+        return None
+    return box
+
+
+def estimate_text_height(image, edge_threshold=60, row_density=0.015, min_height=4):
+    """Высота строки текста в пикселях по профилю строк, None если строк не видно.
+
+    Строки с заметной долей резких горизонтальных перепадов — это строки
+    текста; медиана высот сплошных блоков таких строк и есть высота строки.
+    """
+    gray = np.asarray(image.convert('L'))
+    if gray.shape[0] < min_height or gray.shape[1] < 2:
+        return None
+    profile = edge_row_profile(gray, edge_threshold)
+    heights = [end - start for start, end in _runs(profile >= row_density, max_gap=0)
+               if end - start >= min_height]
+    if not heights:
+        return None
+    return float(np.median(heights))
+
+
+def normalize_text_scale(image, target_height, tolerance=0.15, min_scale=0.25, max_scale=4.0,
+                         max_pixels=4_000_000):
+    """Масштабирует изображение так, чтобы высота строк была около target_height.
+
+    Возвращает (изображение, измеренная высота, коэффициент масштаба).
+    Если высоту измерить не удалось или она уже близка к нужной, изображение
+    возвращается без изменений с коэффициентом 1.0. Увеличение ограничено
+    max_pixels, чтобы полный кадр не раздувался до размеров, на которых
+    tesseract работает секундами.
+    """
+    height = estimate_text_height(image)
+    if height is None:
+        return image, None, 1.0
+    scale = min(max_scale, max(min_scale, target_height / height))
+    if scale > 1.0:
+        scale = max(1.0, min(scale, (max_pixels / (image.width * image.height)) ** 0.5))
+    if abs(scale - 1.0) <= tolerance:
+        return image, height, 1.0
+    new_size = (max(1, round(image.width * scale)), max(1, round(image.height * scale)))
+    resample = Image.LANCZOS if scale < 1.0 else Image.BICUBIC
+    return image.resize(new_size, resample), height, scale
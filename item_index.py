@@ -0,0 +1,133 @@
+import logging
+import os
+from collections import Counter
+
+from database import RECOGNIZED_ITEMS_SQL
+
+logger = logging.getLogger(__name__)
+
+# Сколько кандидатов по общим триграммам проверяется точным расстоянием
+MAX_CANDIDATES = 12
+
+
+def normalize(name):
+    return ' '.join(name.lower().split())
+
+
+def trigrams(text):
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def levenshtein(a, b, limit):
+    """Расстояние редактирования; если оно больше limit, возвращает limit + 1"""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        current = [i]
+        row_min = i
+        for j, cb in enumerate(b, 1):
+            value = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ca != cb))
+            current.append(value)
+            row_min = min(row_min, value)
+        if row_min > limit:
+            return limit + 1
+        previous = current
+    return previous[-1]
+
+
+class ItemIndex:
+    """Словарь известных предметов с нечётким поиском по триграммам.
+
+    Кандидаты отбираются по общим триграммам (инвертированный индекс),
+    затем сравниваются точным расстоянием Левенштейна. Оценка совпадения —
+    1 - расстояние / длина более длинной строки.
+    """
+
+    def __init__(self, names):
+        self.names = {}
+        self.postings = {}
+        for name in names:
+            name = ' '.join(name.split())
+            key = normalize(name)
+            if not key or key in self.names:
+                continue
+            self.names[key] = name
+            for gram in trigrams(key):
+                self.postings.setdefault(gram, []).append(key)
+
+    def __len__(self):
+        return len(self.names)
+
+    def match(self, text, min_score=0.0):
+        """Ближайший известный предмет: (название, оценка) или (None, 0.0)"""
+        key = normalize(text)
+        if not key:
+            return None, 0.0
+        if key in self.names:
+            return self.names[key], 1.0
+
+        shared = Counter()
+        for gram in trigrams(key):
+            shared.update(self.postings.get(gram, ()))
+        if not shared:
+            return None, 0.0
+
+        best_name, best_score = None, 0.0
+        for candidate, _ in shared.most_common(MAX_CANDIDATES):
+            longest = max(len(key), len(candidate))
+            # Кандидаты хуже уже найденного отсекаются ещё при подсчёте расстояния
+            limit = int(longest * (1 - max(best_score, min_score)))
+            distance = levenshtein(key, candidate, limit)
+            if distance > limit:
+                continue
+            score = 1 - distance / longest
+            if score > best_score:
+                best_name, best_score = self.names[candidate], score
+
+        if best_score < min_score:
+            return None, 0.0
+        return best_name, best_score
+
+
+def read_catalogue(path):
+    """Названия предметов из текстового файла: одно на строку, # — комментарий"""
+    if not path or not os.path.exists(path):
+        return []
+    with open(path, encoding='utf-8') as f:
+        return [line.strip() for line in f if line.strip() and not line.startswith('#')]
+
+
+def add_to_catalogue(path, name):
+    """Дописывает проверенное вручную название в каталог"""
+    with open(path, 'a', encoding='utf-8') as f:
+        f.write(' '.join(name.split()) + '\n')
+
+
+def unknown_items(conn, index, min_count):
+    """Частые распознанные названия, которых нет в словаре: кандидаты для ручной проверки.
+
+    Возвращает (название, число выпадений, ближайшее название словаря, оценка),
+    самые частые первыми. В словарь они сами не попадают: ошибки OCR одного
+    шрифта повторяются буква в букву, и выученная ошибка совпадала бы сама с собой.
+    """
+    counts = {}
+    spellings = {}
+    for item, count in conn.execute(RECOGNIZED_ITEMS_SQL):
+        key = normalize(item or '')
+        if key and key not in index.names:
+            counts[key] = counts.get(key, 0) + count
+            spellings.setdefault(key, ' '.join(item.split()))
+    result = []
+    for key, count in sorted(counts.items(), key=lambda pair: -pair[1]):
+        if count >= min_count:
+            result.append((spellings[key], count, *index.match(key)))
+    return result
+
+
+def build_item_index(catalogue_path):
+    """Индекс из каталога: только названия, проверенные вручную"""
+    index = ItemIndex(read_catalogue(catalogue_path))
+    logger.info(f"Словарь предметов: {len(index)} названий")
+    return index
@@ -5,45 +5,64 @@ import os
 from dotenv import load_dotenv
 import asyncio
 import aiohttp
-import io
-from PIL import Image, ImageFilter, ImageEnhance, ImageOps
-import pytesseract
-import re
-import numpy as np
-import colorsys
 import logging
 import threading
+import time
 
 # Импортируем функции из database.py
-from database import init_db, get_db_connection, migrate_database
-
-pytesseract.pytesseract.tesseract_cmd = r'C:\Program Files\Tesseract-OCR\tesseract.exe'
-
-# Настройка логирования
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('bot_debug.log', encoding='utf-8'),
-        logging.StreamHandler()
-    ]
-)
-logger = logging.getLogger(__name__)
-
-# Загрузка переменных окружения
-load_dotenv()
+from database import LOOT_NOT_RECOGNIZED, to_epoch
+import migrations
+import repository
+from config import (OCR_WORKERS, OCR_MAX_BYTES, HTTP_POOL_SIZE, HTTP_TIMEOUT, ARCHIVE_AFTER_DAYS, ARCHIVE_INTERVAL_HOURS,
+                    ARCHIVE_BATCH)
+from ocr_pipeline import recognize_image, get_cache, merge_items
+from ocr_pool import OcrPool
+from attendance_writer import AttendanceWriter
+from spawn_index import SpawnIndex
 
-TOKEN = os.getenv('DISCORD_TOKEN')
-if not TOKEN:
-    logger.error("Токен не найден!")
-    exit(1)
+logger = logging.getLogger(__name__)
 
 intents = discord.Intents.default()
 intents.reactions = True
 intents.members = True
 intents.message_content = True
 
-bot = commands.Bot(command_prefix='!', intents=intents)
+
+class ClanBot(commands.Bot):
+    """Бот с общей HTTP-сессией (пул соединений) на всё время работы"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.http_session = None
+        # on_ready приходит и после каждого переподключения к шлюзу Discord
+        self.started = False
+
+    async def setup_hook(self):
+        self.http_session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=HTTP_POOL_SIZE),
+            timeout=aiohttp.ClientTimeout(total=HTTP_TIMEOUT)
+        )
+        spawn_index.load(await repository.load_latest_spawns())
+
+    async def close(self):
+        if self.http_session is not None:
+            await self.http_session.close()
+        await super().close()
+        # Сначала дописываем отметки участия из очереди, потом закрываем поток базы
+        await attendance_writer.close()
+        await repository.close()
+
+
+bot = ClanBot(command_prefix='!', intents=intents)
+
+# Пул процессов для распознавания скриншотов
+ocr_pool = OcrPool(OCR_WORKERS)
+
+# Очередь отметок участия: всплеск реакций на оповещение пишется одной транзакцией
+attendance_writer = AttendanceWriter()
+
+# Последнее появление каждого босса; меняется только после записи в базу
+spawn_index = SpawnIndex()
 
 # Словарь с боссами и их респауном (в часах)
 BOSS_RESPAWNS = {
@@ -73,10 +92,35 @@ BOSS_EMOJIS = [
     '⏸️', '🔯', '✳️', '🔄'
 ]
 
-# Создаем папки для хранения данных
-os.makedirs('loot_screenshots', exist_ok=True)
-os.makedirs('temp_images', exist_ok=True)
-os.makedirs('debug_images', exist_ok=True)  # Для отладочных изображений
+
+def configure():
+    """Логирование, переменные окружения и папки бота; возвращает токен Discord.
+
+    Вызывается только при запуске main.py, а не при импорте: процессы пула OCR
+    (spawn) заново импортируют этот модуль как __mp_main__, и настройка здесь
+    опередила бы логирование процесса из ocr_pipeline.init_worker.
+    """
+    # Настройка логирования
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(levelname)s - %(message)s',
+        handlers=[
+            logging.FileHandler('bot_debug.log', encoding='utf-8'),
+            logging.StreamHandler()
+        ]
+    )
+
+    # Загрузка переменных окружения
+    load_dotenv()
+
+    token = os.getenv('DISCORD_TOKEN')
+    if not token:
+        logger.error("Токен не найден!")
+        exit(1)
+
+    # Создаем папки для хранения данных
+    os.makedirs('loot_screenshots', exist_ok=True)
+    return token
 
 
 # Запуск веб-сервера в отдельном потоке
@@ -87,9 +131,13 @@ def run_web_app():
 
 @bot.event
 async def on_ready():
+    if bot.started:
+        logger.info(f'Бот {bot.user} переподключился')
+        return
+    bot.started = True
     logger.info(f'Бот {bot.user} запущен!')
-    init_db()
     check_respawns.start()
+    archive_old_spawns.start()
 
     # Запускаем веб-сервер в отдельном потоке
     web_thread = threading.Thread(target=run_web_app)
@@ -97,188 +145,70 @@ async def on_ready():
     web_thread.start()
     logger.info("Веб-сервер запущен на http://0.0.0.0:8080")
 
-def save_debug_image(image, name):
-    """Сохраняет изображение для отладки"""
-    debug_path = f"debug_images/{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}_{name}.png"
-    image.save(debug_path, 'PNG')
-    return debug_path
-
-
-def extract_items(text):
-    """Извлекает названия предметов между 'acquired' и 'from'"""
-    logger.info("Извлекаем названия предметов из текста")
-
-    # Регулярное выражение для поиска текста между "acquired" и "from"
-    pattern = r'acquired\s+(.*?)\s+from'
-    items = re.findall(pattern, text, re.IGNORECASE)
-
-    # Очищаем результаты
-    cleaned_items = []
-    for item in items:
-        # Убираем лишние пробелы и переносы строк
-        cleaned_item = ' '.join(item.split())
-        # Убираем возможные точки и запятые в конце
-        cleaned_item = cleaned_item.rstrip('.,')
-        cleaned_items.append(cleaned_item)
-
-    logger.info(f"Найдено {len(cleaned_items)} предметов")
-    return cleaned_items
-
-
-def enhance_gray(image):
-    """Вариант 1: простая бинаризация"""
-    logger.info("Применяем серый метод обработки")
-    img = image.convert("L")  # в серый
-    img = ImageOps.autocontrast(img)
-    img = ImageOps.invert(img)  # текст становится чёрным
-    enhancer = ImageEnhance.Sharpness(img)
-    img = enhancer.enhance(2.0)
-    enhancer = ImageEnhance.Contrast(img)
-    img = enhancer.enhance(2.0)
-    return img
-
-
-def enhance_hsv(image):
-    """Вариант 2: HSV фильтрация цветного текста"""
-    logger.info("Применяем HSV метод обработки")
-    img = image.convert("RGB")
-    img_array = np.array(img)
-
-    # RGB → HSV
-    hsv_array = np.zeros_like(img_array, dtype=float)
-    for y in range(img_array.shape[0]):
-        for x in range(img_array.shape[1]):
-            r, g, b = img_array[y, x] / 255.0
-            h, s, v = colorsys.rgb_to_hsv(r, g, b)
-            hsv_array[y, x] = [h * 360, s * 100, v * 100]
-
-    # Диапазоны цветов (H, S, V)
-    ranges = [
-        ((0, 10), (50, 100), (30, 100)),  # красный 1
-        ((340, 360), (50, 100), (30, 100)),  # красный 2
-        ((80, 150), (30, 100), (30, 100)),  # зелёный
-        ((180, 260), (30, 100), (30, 100)),  # синий
-        ((260, 320), (30, 100), (30, 100)),  # фиолетовый
-        ((30, 70), (30, 100), (30, 100)),  # жёлтый
-        ((0, 360), (0, 20), (40, 100)),  # серый/белый обычный текст
-    ]
-
-    # Маска текста
-    h, s, v = hsv_array[:, :, 0], hsv_array[:, :, 1], hsv_array[:, :, 2]
-    text_mask = np.zeros(img_array.shape[:2], dtype=bool)
-    for h_range, s_range, v_range in ranges:
-        mask = ((h >= h_range[0]) & (h <= h_range[1]) &
-                (s >= s_range[0]) & (s <= s_range[1]) &
-                (v >= v_range[0]) & (v <= v_range[1]))
-        text_mask |= mask
-
-    # Чёрный текст на белом фоне
-    enhanced_array = np.ones_like(img_array) * 255
-    enhanced_array[text_mask] = [0, 0, 0]
-    return Image.fromarray(enhanced_array.astype("uint8"))
-
-
-def enhance_image_for_ocr(image):
-    """Гибрид: пробуем два методы и выбираем лучший"""
-    # Сохраняем оригинал
-    original_path = save_debug_image(image, "01_original")
-    logger.info(f"Сохранено исходное изображение: {original_path}")
-
-    # Пробуем оба метода
-    gray_variant = enhance_gray(image)
-    hsv_variant = enhance_hsv(image)
-
-    # Сохраняем оба варианта для отладки
-    gray_path = save_debug_image(gray_variant, "02_gray_method")
-    logger.info(f"Сохранено изображение после серого метода: {gray_path}")
-    hsv_path = save_debug_image(hsv_variant, "03_hsv_method")
-    logger.info(f"Сохранено изображение после HSV метода: {hsv_path}")
-
-    # Проверяем OCR на обоих
-    custom_config = r'--oem 3 --psm 6'
-    text_gray = pytesseract.image_to_string(gray_variant, lang='eng', config=custom_config)
-    text_hsv = pytesseract.image_to_string(hsv_variant, lang='eng', config=custom_config)
-
-    # Выбираем лучший по количеству символов
-    if len(text_hsv.strip()) > len(text_gray.strip()):
-        best_img = hsv_variant
-        best_text = text_hsv
-        method = "HSV"
-        logger.info(f"Выбран метод HSV, количество символов: {len(text_hsv.strip())}")
-    else:
-        best_img = gray_variant
-        best_text = text_gray
-        method = "GRAY"
-        logger.info(f"Выбран метод GRAY, количество символов: {len(text_gray.strip())}")
-
-    # Сохраняем финальное изображение
-    final_path = save_debug_image(best_img, f"04_final_{method}")
-    logger.info(f"Сохранено финальное изображение: {final_path}")
-
-    return best_img, best_text, method
-
-
-async def process_image_with_ocr(image_url):
-    try:
-        logger.info(f"Начинаем обработку изображения: {image_url}")
-
-        async with aiohttp.ClientSession() as session:
-            async with session.get(image_url) as resp:
-                if resp.status == 200:
-                    image_data = await resp.read()
-                    image = Image.open(io.BytesIO(image_data))
-
-                    # Конвертируем в RGB если нужно
-                    if image.mode != 'RGB':
-                        image = image.convert('RGB')
-
-                    # Улучшаем качество изображения для лучшего распознавания
-                    enhanced_image, text, method = enhance_image_for_ocr(image)
-
-                    # Извлекаем предметы из текста
-                    items = extract_items(text)
-
-                    # Сохраняем временную копию для обработки
-                    temp_path = f"temp_images/{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}.png"
-                    enhanced_image.save(temp_path, 'PNG')
-                    logger.info(f"Сохранено временное изображение: {temp_path}")
-
-                    # Используем OCR для извлечения текста с разными настройками
-                    configs = [
-                        r'--oem 3 --psm 6',
-                        r'--oem 3 --psm 7',
-                        r'--oem 3 --psm 8',
-                        r'--oem 3 --psm 13'
-                    ]
-
-                    best_text = text
-                    best_config = ""
+async def download_attachment(attachment):
+    """Скачивает вложение один раз через общую сессию бота"""
+    async with bot.http_session.get(attachment.url) as resp:
+        if resp.status != 200:
+            logger.error(f"Ошибка загрузки изображения: статус {resp.status}")
+            return None
+        return await resp.read()
 
-                    for config in configs:
-                        try:
-                            new_text = pytesseract.image_to_string(enhanced_image, lang='eng', config=config)
-                            logger.info(f"Распознанный текст с конфигом {config}:\n{new_text}")
 
-                            # Если этот конфиг дал больше текста, сохраняем его
-                            if len(new_text) > len(best_text):
-                                best_text = new_text
-                                best_config = config
-                        except Exception as e:
-                            logger.error(f"Ошибка при распознавании с конфигом {config}: {e}")
+def save_screenshot(path, image_data):
+    with open(path, 'wb') as f:
+        f.write(image_data)
 
-                    logger.info(f"Лучший конфиг: {best_config}")
-                    logger.info(f"Лучший распознанный текст:\n{best_text}")
 
-                    # Извлекаем предметы из лучшего текста
-                    final_items = extract_items(best_text)
+async def process_image_with_ocr(image_data):
+    try:
+        logger.info(f"Начинаем обработку изображения ({len(image_data)} байт)")
 
-                    return final_items, temp_path
-                else:
-                    logger.error(f"Ошибка загрузки изображения: статус {resp.status}")
-                    return [], None
+        # Распознавание выполняется в отдельном процессе, бот продолжает работать
+        return await ocr_pool.run(recognize_image, image_data)
     except Exception as e:
         logger.error(f"Ошибка при обработке изображения: {e}")
-        return [], None
+        return []
+
+
+async def process_loot_attachment(attachment, prefix):
+    """Скачивает, сохраняет и распознаёт один скриншот; возвращает (путь, предметы)"""
+    # Скачиваем скриншот один раз: эти же байты идут и на диск, и в OCR
+    try:
+        image_data = await download_attachment(attachment)
+    except Exception as e:
+        logger.error(f"Ошибка загрузки вложения {attachment.filename}: {e}")
+        return None, []
+    if image_data is None:
+        return None, []
+
+    # Сохраняем скриншот
+    screenshot_path = f"loot_screenshots/{prefix}_{attachment.filename}"
+    await asyncio.to_thread(save_screenshot, screenshot_path, image_data)
+    logger.info(f"Сохранен скриншот дропа: {screenshot_path}")
+
+    # Лимит защищает только декодирование и OCR: скриншот сохранён, дроп запишется как нераспознанный
+    if len(image_data) > OCR_MAX_BYTES:
+        logger.warning(f"Скриншот {screenshot_path} не распознаётся: {len(image_data)} байт "
+                       f"(лимит OCR {OCR_MAX_BYTES})")
+        return screenshot_path, []
+
+    # Анализируем скриншот с помощью OCR
+    items = await process_image_with_ocr(image_data)
+    return screenshot_path, items
+
+
+@bot.command()
+async def ocrstats(ctx):
+    """Состояние очереди распознавания скриншотов"""
+    stats = ocr_pool.stats()
+    cache_stats = get_cache().stats()
+    await ctx.send(
+        f"🔍 OCR: процессов {stats['workers']}, в работе {stats['in_flight']}, "
+        f"в очереди {stats['queued']}, готово {stats['completed']}, ошибок {stats['failed']}\n"
+        f"🗃️ Кеш: записей {cache_stats['entries']}, попаданий {cache_stats['hits']} "
+        f"(+{cache_stats['phash_hits']} по похожести), промахов {cache_stats['misses']}, "
+        f"вытеснено {cache_stats['evictions']}"
+    )
 
 
 @bot.command()
@@ -331,15 +261,6 @@ async def on_reaction_add(reaction, user):
         if not channel:
             channel = reaction.message.channel
 
-        conn = get_db_connection()
-        cursor = conn.cursor()
-
-        # Помечаем все предыдущие записи этого босса как неактуальные
-        cursor.execute(
-            'UPDATE boss_kills SET is_killed = 1, respawn_notified = 1 WHERE boss_name = ? AND is_killed = 0',
-            (boss_name,)
-        )
-
         message = await channel.send(
             f"@everyone\n"
             f"🔥 БОСС ПОЯВИЛСЯ!\n"
@@ -353,65 +274,25 @@ async def on_reaction_add(reaction, user):
         await message.add_reaction('✅')
 
         now = datetime.datetime.now()
-        kill_time = (now + datetime.timedelta(minutes=5)).strftime("%Y-%m-%d %H:%M")
+        kill_time = to_epoch(now + datetime.timedelta(minutes=5))
         respawn_hours = BOSS_RESPAWNS[boss_name]
-        respawn_time = (now + datetime.timedelta(hours=respawn_hours)).strftime("%Y-%m-%d %H:%M")
+        respawn_time = to_epoch(now + datetime.timedelta(hours=respawn_hours))
 
-        cursor.execute(
-            'INSERT INTO boss_kills (boss_name, kill_time, respawn, message_id, channel_id) VALUES (?, ?, ?, ?, ?)',
-            (boss_name, kill_time, respawn_time, message.id, channel.id)
-        )
-        conn.commit()
-        conn.close()
+        # Все прошлые записи этого босса становятся неактуальными
+        spawn_index.put(await repository.mark_spawn(boss_name, kill_time, respawn_time, message.id, channel.id))
 
         logger.info(f"Создано уведомление о боссе {boss_name} (ID сообщения: {message.id})")
         return
 
     # Обработка участия в убийстве босса
     if str(reaction.emoji) == "✅" and reaction.message.channel.name == "boss_alert":
-        conn = get_db_connection()
-        cursor = conn.cursor()
-
-        # Получаем только актуальную запись (последнее появление босса)
-        cursor.execute('''
-            SELECT id, is_killed 
-            FROM boss_kills 
-            WHERE message_id = ? 
-            AND id = (
-                SELECT MAX(id) 
-                FROM boss_kills 
-                WHERE boss_name = (
-                    SELECT boss_name 
-                    FROM boss_kills 
-                    WHERE message_id = ?
-                )
-            )
-        ''', (reaction.message.id, reaction.message.id))
-
-        boss_kill = cursor.fetchone()
-
-        if boss_kill and not boss_kill['is_killed']:
-            cursor.execute(
-                'SELECT * FROM boss_attendance WHERE boss_kill_id = ? AND user_id = ?',
-                (boss_kill['id'], user.id)
-            )
-            existing = cursor.fetchone()
-
-            if not existing:
-                cursor.execute(
-                    'INSERT INTO boss_attendance (boss_kill_id, user_id, username, attended) VALUES (?, ?, ?, 1)',
-                    (boss_kill['id'], user.id, str(user))
-                )
-                logger.info(f"Пользователь {user} добавлен к участию в убийстве босса (ID: {boss_kill['id']})")
-            else:
-                cursor.execute(
-                    'UPDATE boss_attendance SET attended = 1 WHERE boss_kill_id = ? AND user_id = ?',
-                    (boss_kill['id'], user.id)
-                )
-                logger.info(f"Пользователь {user} подтвердил участие в убийстве босса (ID: {boss_kill['id']})")
-
-            conn.commit()
-        conn.close()
+        # Отметиться можно только на актуальном (последнем) и ещё не убитом появлении босса
+        spawn = spawn_index.active(reaction.message.id)
+        if spawn is None or spawn.is_killed:
+            return
+        # Отметки копятся и пишутся пачкой
+        attendance_writer.add(spawn.id, user.id, str(user), True)
+        logger.info(f"Пользователь {user} отметил участие (сообщение {reaction.message.id})")
 
 
 @bot.event
@@ -420,23 +301,13 @@ async def on_reaction_remove(reaction, user):
         return
 
     if str(reaction.emoji) == "✅" and reaction.message.channel.name == "boss_alert":
-        conn = get_db_connection()
-        cursor = conn.cursor()
-
-        cursor.execute(
-            'SELECT id FROM boss_kills WHERE message_id = ?',
-            (reaction.message.id,)
-        )
-        boss_kill = cursor.fetchone()
-
-        if boss_kill:
-            cursor.execute(
-                'UPDATE boss_attendance SET attended = 0 WHERE boss_kill_id = ? AND user_id = ?',
-                (boss_kill['id'], user.id)
-            )
-            conn.commit()
-            logger.info(f"Пользователь {user} отменил участие в убийстве босса (ID: {boss_kill['id']})")
-        conn.close()
+        # Снять отметку можно и со старого оповещения, его уже нет в индексе
+        spawn = spawn_index.active(reaction.message.id)
+        spawn_id = spawn.id if spawn else await repository.find_spawn_by_message(reaction.message.id)
+        if spawn_id is None:
+            return
+        attendance_writer.add(spawn_id, user.id, str(user), False)
+        logger.info(f"Пользователь {user} отменил участие (сообщение {reaction.message.id})")
 
 
 @bot.event
@@ -445,8 +316,8 @@ async def on_message(message):
         await bot.process_commands(message)
         return
 
-    # Обработка ответов на сообщения о боссах
-    if message.reference and message.reference.message_id:
+    # Обработка ответов на сообщения о боссах: без запроса к Discord, если это не актуальное оповещение
+    if message.reference and spawn_index.active(message.reference.message_id):
         try:
             replied_message = await message.channel.fetch_message(message.reference.message_id)
 
@@ -454,61 +325,38 @@ async def on_message(message):
                     replied_message.channel.name == "boss_alert" and
                     "🔥 БОСС ПОЯВИЛСЯ!" in replied_message.content):
 
-                conn = get_db_connection()
-                cursor = conn.cursor()
-
                 # Получаем только актуальную запись (последнее появление босса)
-                cursor.execute('''
-                    SELECT id, is_killed 
-                    FROM boss_kills 
-                    WHERE message_id = ? 
-                    AND id = (
-                        SELECT MAX(id) 
-                        FROM boss_kills 
-                        WHERE boss_name = (
-                            SELECT boss_name 
-                            FROM boss_kills 
-                            WHERE message_id = ?
-                        )
-                    )
-                ''', (replied_message.id, replied_message.id))
+                spawn = spawn_index.active(replied_message.id)
 
-                boss_kill = cursor.fetchone()
+                if spawn and not spawn.is_killed:
+                    # Обрабатываем вложения (скриншоты дропа)
+                    image_attachments = [
+                        attachment for attachment in message.attachments
+                        if any(attachment.filename.lower().endswith(ext) for ext in
+                               ['.png', '.jpg', '.jpeg', '.gif', '.bmp'])
+                    ]
 
-                if boss_kill and not boss_kill['is_killed']:
-                    # Помечаем босса как убитого
-                    cursor.execute(
-                        'UPDATE boss_kills SET is_killed = 1 WHERE id = ?',
-                        (boss_kill['id'],)
-                    )
+                    # Все скриншоты скачиваются и распознаются одновременно (OCR ограничен пулом процессов)
+                    timestamp = datetime.datetime.now().strftime('%Y%m%d_%H%M%S')
+                    results = await asyncio.gather(*(
+                        process_loot_attachment(attachment, f"{timestamp}_{index}")
+                        for index, attachment in enumerate(image_attachments)
+                    ))
 
-                    # Обрабатываем вложения (скриншоты дропа)
-                    loot_items = []
-                    screenshot_path = None
-
-                    if message.attachments:
-                        for attachment in message.attachments:
-                            if any(attachment.filename.lower().endswith(ext) for ext in
-                                   ['.png', '.jpg', '.jpeg', '.gif', '.bmp']):
-                                # Сохраняем скриншот
-                                screenshot_path = f"loot_screenshots/{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}_{attachment.filename}"
-                                await attachment.save(screenshot_path)
-                                logger.info(f"Сохранен скриншот дропа: {screenshot_path}")
-
-                                # Анализируем скриншот с помощью OCR
-                                items, _ = await process_image_with_ocr(attachment.url)
-                                loot_items.extend(items)
+                    saved_paths = [path for path, _ in results if path]
+                    screenshot_path = saved_paths[-1] if saved_paths else None
+                    loot_items = merge_items([items for _, items in results])
 
                     # Сохраняем информацию о дропе в базу данных
-                    loot_text = "\n".join(loot_items) if loot_items else "Не удалось распознать дроп"
+                    loot_text = "\n".join(loot_items) if loot_items else LOOT_NOT_RECOGNIZED
 
-                    cursor.execute(
-                        'INSERT INTO boss_loot (boss_kill_id, user_id, username, screenshot_path, loot_text, created_at) VALUES (?, ?, ?, ?, ?, ?)',
-                        (boss_kill['id'], message.author.id, str(message.author), screenshot_path, loot_text,
-                         datetime.datetime.now().strftime("%Y-%m-%d %H:%M"))
-                    )
+                    # Отметки, поставленные до убийства, должны попасть в базу раньше него
+                    await attendance_writer.flush()
 
-                    conn.commit()
+                    # Помечаем босса как убитого и сохраняем дроп
+                    await repository.record_loot(spawn.id, message.author.id, str(message.author),
+                                                 screenshot_path, loot_text, loot_items)
+                    spawn_index.update(spawn.id, is_killed=1)
 
                     # Удаляем реакцию ✅ и добавляем ☠️
                     await replied_message.clear_reactions()
@@ -567,8 +415,6 @@ async def on_message(message):
                             f"📦 Не удалось распознать предметы из скриншота. Пожалуйста, проверьте качество изображения."
                         )
                         logger.warning(f"Не удалось распознать предметы из скриншота {screenshot_path}")
-
-                conn.close()
         except Exception as e:
             logger.error(f"Ошибка при обработке ответа на сообщение: {e}")
 
@@ -579,68 +425,57 @@ async def on_message(message):
 @tasks.loop(minutes=5)
 async def check_respawns():
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-
-        # Получаем только актуальные записи (последнее убийство для каждого босса)
-        cursor.execute('''
-            SELECT bk1.* 
-            FROM boss_kills bk1
-            INNER JOIN (
-                SELECT boss_name, MAX(id) as max_id
-                FROM boss_kills
-                GROUP BY boss_name
-            ) bk2 ON bk1.id = bk2.max_id
-            WHERE bk1.respawn_notified = 0 AND bk1.is_killed = 1
-        ''')
-
-        bosses_to_respawn = cursor.fetchall()
         now = datetime.datetime.now()
 
-        for boss in bosses_to_respawn:
+        # Последнее убийство каждого босса, респавн которого уже наступил
+        for boss in spawn_index.due(to_epoch(now)):
             try:
-                respawn_time = datetime.datetime.strptime(boss['respawn'], "%Y-%m-%d %H:%M")
-
-                if now >= respawn_time:
-                    channel = bot.get_channel(boss['channel_id'])
-                    if channel:
-                        # Отправляем прямое уведомление о появлении босса
-                        message = await channel.send(
-                            f"@everyone\n"
-                            f"🔥 БОСС ПОЯВИЛСЯ!\n"
-                            f"{boss['boss_name']} - сейчас появится\n\n"
-                            f"Поставьте реакцию ✅ для отметки участия на боссе\n\n"
-                            f"📍 Действия\n"
-                            f"✅ - Участвую в убийстве босса\n"
-                            f"💬 - Ответьте на это сообщение со скриншотом дропа чтобы отметить убийство босса"
-                        )
-
-                        await message.add_reaction('✅')
-
-                        # Создаем новую запись в базе данных для нового появления босса
-                        new_kill_time = (now + datetime.timedelta(minutes=5)).strftime("%Y-%m-%d %H:%M")
-                        respawn_hours = BOSS_RESPAWNS.get(boss['boss_name'], 24)  # Значение по умолчанию 24 часа
-                        new_respawn_time = (now + datetime.timedelta(hours=respawn_hours)).strftime("%Y-%m-%d %H:%M")
+                channel = bot.get_channel(boss.channel_id)
+                if channel:
+                    # Отправляем прямое уведомление о появлении босса
+                    message = await channel.send(
+                        f"@everyone\n"
+                        f"🔥 БОСС ПОЯВИЛСЯ!\n"
+                        f"{boss.boss_name} - сейчас появится\n\n"
+                        f"Поставьте реакцию ✅ для отметки участия на боссе\n\n"
+                        f"📍 Действия\n"
+                        f"✅ - Участвую в убийстве босса\n"
+                        f"💬 - Ответьте на это сообщение со скриншотом дропа чтобы отметить убийство босса"
+                    )
 
-                        cursor.execute(
-                            'INSERT INTO boss_kills (boss_name, kill_time, respawn, message_id, channel_id) VALUES (?, ?, ?, ?, ?)',
-                            (boss['boss_name'], new_kill_time, new_respawn_time, message.id, channel.id)
-                        )
+                    await message.add_reaction('✅')
 
-                        # Помечаем старую запись как обработанную
-                        cursor.execute(
-                            'UPDATE boss_kills SET respawn_notified = 1 WHERE id = ?',
-                            (boss['id'],)
-                        )
+                    # Создаем новую запись для нового появления босса, старая помечается обработанной
+                    new_kill_time = to_epoch(now + datetime.timedelta(minutes=5))
+                    respawn_hours = BOSS_RESPAWNS.get(boss.boss_name, 24)  # Значение по умолчанию 24 часа
+                    new_respawn_time = to_epoch(now + datetime.timedelta(hours=respawn_hours))
 
-                        conn.commit()
-                        logger.info(f"Автоматически создано уведомление о появлении босса {boss['boss_name']}")
+                    spawn_index.put(await repository.mark_spawn(boss.boss_name, new_kill_time, new_respawn_time,
+                                                                message.id, channel.id, previous_id=boss.id))
+                    logger.info(f"Автоматически создано уведомление о появлении босса {boss.boss_name}")
             except Exception as e:
-                logger.error(f"Ошибка при обработке респавна босса {boss['boss_name']}: {e}")
-
-        conn.close()
+                logger.error(f"Ошибка при обработке респавна босса {boss.boss_name}: {e}")
     except Exception as e:
         logger.error(f"Ошибка в задаче check_respawns: {e}")
 
+
+# Фоновая задача: перенос старых появлений, отметок и дропа в архивную базу
+@tasks.loop(hours=ARCHIVE_INTERVAL_HOURS)
+async def archive_old_spawns():
+    try:
+        start = time.perf_counter()
+        before = to_epoch(datetime.datetime.now() - datetime.timedelta(days=ARCHIVE_AFTER_DAYS))
+        moved = await repository.archive_old(before, ARCHIVE_BATCH)
+        if moved:
+            logger.info(f"Перенесено в архив за {time.perf_counter() - start:.1f} с: {moved}")
+    except Exception as e:
+        logger.error(f"Ошибка в задаче archive_old_spawns: {e}")
+
 if __name__ == "__main__":
-    bot.run(TOKEN)
\ No newline at end of file
+    TOKEN = configure()
+    # Схема базы обновляется один раз до подключения к Discord
+    migrations.migrate()
+    try:
+        bot.run(TOKEN)
+    finally:
+        ocr_pool.shutdown()
\ No newline at end of file
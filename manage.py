@@ -0,0 +1,261 @@
+"""Служебные команды для базы данных бота.
+
+Примеры:
+    python manage.py migrate
+    python manage.py explain
+    python manage.py explain --db crp_clan.db
+    python manage.py rebuild-rollups
+    python manage.py backfill-loot
+    python manage.py archive --days 90
+    python manage.py vacuum
+    python manage.py items
+    python manage.py items --add "Epic Sword"
+
+migrate — применяет недостающие миграции схемы (migrations.py) и печатает
+версию и историю из schema_version. Бот и сайт делают то же при старте.
+
+explain — проверка планов частых запросов бота и сайта (EXPLAIN QUERY PLAN):
+ни один из них не должен читать таблицу целиком — ни сам по себе, ни проходом
+по всему индексу. Проход по индексу допустим, только если он даёт порядок
+ORDER BY и обрывается на LIMIT, или если запрос явно отмечен в QUERY_PLAN_CHECKS
+как разрешённый полный просмотр. Без --db схема создаётся в
+памяти, с --db проверяется рабочая база (с её статистикой ANALYZE). Код
+возврата 1, если хотя бы один запрос делает полный просмотр таблицы.
+
+rebuild-rollups — пересчёт сводки участия attendance_daily, итогов участия
+attendance_totals и счётчиков убийств boss_kill_counts одной транзакцией (после
+ручной правки таблиц или сбоя).
+
+backfill-loot — раскладывает loot_text старых записей boss_loot по предметам
+в loot_items (и полнотекстовый индекс) пачками; повторный запуск безопасен.
+
+archive — разовый перенос старых появлений в архивную базу (то же, что делает
+бот раз в ARCHIVE_INTERVAL_HOURS часов), затем incremental vacuum.
+
+items — частые распознанные названия предметов, которых нет в каталоге
+ITEM_CATALOGUE_PATH, с ближайшим названием каталога. Распознанный текст сам в
+словарь OCR не попадает: проверенное название добавляется вручную (--add).
+
+vacuum — однократное включение auto_vacuum = INCREMENTAL для базы, созданной
+раньше, полным VACUUM. Переписывает всю базу (нужно свободное место примерно
+в её размер), выполнять при остановленном боте. Без этого архивация не
+уменьшает файл базы.
+"""
+import argparse
+import os
+import re
+import sqlite3
+import sys
+import time
+from datetime import datetime, timedelta
+
+import archiver
+import database
+import item_index
+import migrations
+from config import ARCHIVE_AFTER_DAYS, ARCHIVE_BATCH, ITEM_CATALOGUE_PATH
+
+# (название, запрос, разрешён ли полный просмотр таблицы)
+QUERY_PLAN_CHECKS = [
+    ('main: последние появления боссов (при старте)', database.LATEST_SPAWNS_SQL, False),
+    ('main: появление по сообщению', database.SPAWN_BY_MESSAGE_SQL, False),
+    ('main: закрытие прошлых появлений босса', database.CLOSE_OPEN_SPAWNS_SQL, False),
+    ('main: отметка участия', database.UPSERT_ATTENDANCE_SQL, False),
+    ('main: изменение отметки участия', database.SET_ATTENDED_SQL, False),
+    ('web: ближайшие респавны', database.UPCOMING_SPAWNS_SQL, False),
+    ('web: топ боссов', database.TOP_BOSSES_SQL, False),
+    ('web: последний дроп', database.RECENT_LOOT_SQL, False),
+    ('web: топ игроков и статистика за период', database.LEADERBOARD_SQL, False),
+    ('web: топ игроков за всё время', database.LEADERBOARD_ALL_TIME_SQL, False),
+    ('web: поиск дропа по предмету', database.LOOT_SEARCH_SQL, False),
+    ('web: число выпадений предметов', database.ITEM_DROP_COUNTS_SQL, False),
+    ('web: боссы на странице админа', database.ADMIN_BOSSES_SQL, False),
+    # Только по покрывающему индексу, в рабочей базе без архива
+    ('web: игроки на странице админа', database.ADMIN_MEMBERS_SQL, True),
+]
+
+# Просмотр таблицы целиком: "SCAN boss_kills", "SCAN ba", "SCAN main.boss_kills"
+# (в старых версиях SQLite — "SCAN TABLE ...") и проход по всему индексу
+# "SCAN boss_kills USING [COVERING] INDEX ...". Просмотр результата подзапроса,
+# представления или CTE (CO-ROUTINE, MATERIALIZE) — не чтение таблицы
+FULL_SCAN = re.compile(r'^SCAN (TABLE )?([\w.]+)( AS \w+)?( USING (COVERING )?INDEX \w+)?$')
+SUBQUERY = re.compile(r'^(CO-ROUTINE|MATERIALIZE) (\S+)')
+ORDER_BY_LIMIT = re.compile(r'\bORDER BY\b[^()]*\bLIMIT\b', re.S)
+
+
+def query_plan(conn, sql):
+    params = (None,) * sql.count('?')
+    return [row[-1] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}", params)]
+
+
+def migrate(args):
+    conn = database.connect(args.db or database.DB_PATH)
+    version = migrations.migrate(conn)
+    print(f"Версия схемы: {version}")
+    for row in conn.execute('SELECT version, name, applied_at, duration_ms FROM schema_version ORDER BY version'):
+        print(f"    {row['version']}. {row['name']}: {database.format_time(row['applied_at'])}, {row['duration_ms']} мс")
+    conn.close()
+    return 0
+
+
+def full_scans(sql, plan):
+    """Строки плана, которые читают таблицу или индекс целиком"""
+    subqueries = {match.group(2) for match in map(SUBQUERY.match, plan) if match}
+    # Проход по индексу в порядке ORDER BY без сортировки останавливается на LIMIT
+    bounded = ORDER_BY_LIMIT.search(sql) and not any('FOR ORDER BY' in line for line in plan)
+    scans = []
+    for line in plan:
+        match = FULL_SCAN.match(line)
+        if not match or match.group(2) in subqueries:
+            continue
+        if match.group(4) and bounded:
+            continue
+        scans.append(line)
+    return scans
+
+
+def explain(args):
+    conn = sqlite3.connect(args.db or ':memory:')
+    conn.row_factory = sqlite3.Row
+    database.attach_archive(conn, database.archive_path(args.db or ':memory:'))
+    if not args.db:
+        migrations.migrate(conn)
+
+    failed = False
+    for name, sql, allow_scan in QUERY_PLAN_CHECKS:
+        plan = query_plan(conn, sql)
+        scans = full_scans(sql, plan)
+        bad = bool(scans) and not allow_scan
+        failed |= bad
+        status = 'ПОЛНЫЙ ПРОСМОТР' if bad else ('полный просмотр разрешён' if scans else 'ok')
+        print(f"{name}: {status}")
+        for line in plan:
+            print(f"    {line}")
+    conn.close()
+    return 1 if failed else 0
+
+
+def rebuild_rollups(args):
+    conn = database.connect(args.db or database.DB_PATH)
+    migrations.migrate(conn)
+    start = time.perf_counter()
+    with conn:
+        rows = database.rebuild_attendance_rollup(conn.cursor())
+        users = database.rebuild_attendance_totals(conn.cursor())
+        bosses = database.rebuild_boss_kill_counts(conn.cursor())
+    print(f"attendance_daily: {rows} строк, attendance_totals: {users} игроков, boss_kill_counts: {bosses} боссов "
+          f"за {time.perf_counter() - start:.2f} с")
+    conn.close()
+    return 0
+
+
+def backfill_loot(args):
+    conn = database.connect(args.db or database.DB_PATH)
+    migrations.migrate(conn)
+    start = time.perf_counter()
+    loots, items = database.backfill_loot_items(conn, args.batch)
+    print(f"loot_items: {items} предметов из {loots} записей boss_loot за {time.perf_counter() - start:.2f} с")
+    conn.close()
+    return 0
+
+
+def archive(args):
+    conn = database.connect(args.db or database.DB_PATH)
+    migrations.migrate(conn)
+    before = database.to_epoch(datetime.now() - timedelta(days=args.days))
+    start = time.perf_counter()
+    totals = {}
+    while True:
+        moved = archiver.archive_batch(conn, before, args.batch)
+        if not moved:
+            break
+        for table, rows in moved.items():
+            totals[table] = totals.get(table, 0) + rows
+    free_pages = archiver.reclaim_space(conn) if totals else 0
+    print(f"Перенесено в архив за {time.perf_counter() - start:.2f} с: {totals or 'нечего переносить'}")
+    print(f"Освобождено страниц: {free_pages}")
+    conn.close()
+    return 0
+
+
+def vacuum(args):
+    path = args.db or database.DB_PATH
+    conn = database.connect(path)
+    # Размер файла считаем после переноса журнала WAL в базу
+    conn.execute('PRAGMA main.wal_checkpoint(TRUNCATE)')
+    size = os.path.getsize(path)
+    start = time.perf_counter()
+    if archiver.enable_incremental_vacuum(conn):
+        conn.execute('PRAGMA main.wal_checkpoint(TRUNCATE)')
+        print(f"auto_vacuum = INCREMENTAL включён за {time.perf_counter() - start:.2f} с: "
+              f"{size / 2 ** 20:.1f} МБ → {os.path.getsize(path) / 2 ** 20:.1f} МБ")
+    else:
+        print("auto_vacuum = INCREMENTAL уже включён")
+    print(f"Освобождено страниц: {archiver.reclaim_space(conn)}")
+    conn.close()
+    return 0
+
+
+def items(args):
+    if args.add:
+        item_index.add_to_catalogue(ITEM_CATALOGUE_PATH, args.add)
+        print(f"Добавлено в {ITEM_CATALOGUE_PATH}: {' '.join(args.add.split())}")
+        return 0
+
+    conn = database.connect(args.db or database.DB_PATH)
+    migrations.migrate(conn)
+    index = item_index.build_item_index(ITEM_CATALOGUE_PATH)
+    candidates = item_index.unknown_items(conn, index, args.min_count)
+    print(f"Каталог: {len(index)} названий, нет в каталоге: {len(candidates)}")
+    for name, count, nearest, score in candidates[:args.limit]:
+        hint = f"  ближе всего: {nearest} ({score:.2f})" if nearest else ''
+        print(f"{count:>6}  {name}{hint}")
+    conn.close()
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    migrate_parser = commands.add_parser('migrate', help='Применить миграции схемы')
+    migrate_parser.add_argument('--db', help='Путь к базе (по умолчанию DB_PATH)')
+    migrate_parser.set_defaults(handler=migrate)
+
+    explain_parser = commands.add_parser('explain', help='Проверить планы частых запросов')
+    explain_parser.add_argument('--db', help='Путь к базе (по умолчанию схема в памяти)')
+    explain_parser.set_defaults(handler=explain)
+
+    rollups_parser = commands.add_parser('rebuild-rollups', help='Пересчитать сводку участия и счётчики убийств')
+    rollups_parser.add_argument('--db', help='Путь к базе (по умолчанию DB_PATH)')
+    rollups_parser.set_defaults(handler=rebuild_rollups)
+
+    loot_parser = commands.add_parser('backfill-loot', help='Разложить старый дроп по предметам')
+    loot_parser.add_argument('--db', help='Путь к базе (по умолчанию DB_PATH)')
+    loot_parser.add_argument('--batch', type=int, default=database.LOOT_BACKFILL_BATCH,
+                             help='Записей boss_loot за транзакцию')
+    loot_parser.set_defaults(handler=backfill_loot)
+
+    archive_parser = commands.add_parser('archive', help='Перенести старые появления в архив')
+    archive_parser.add_argument('--db', help='Путь к базе (по умолчанию DB_PATH)')
+    archive_parser.add_argument('--days', type=int, default=ARCHIVE_AFTER_DAYS, help='Горизонт архивации в днях')
+    archive_parser.add_argument('--batch', type=int, default=ARCHIVE_BATCH, help='Появлений за транзакцию')
+    archive_parser.set_defaults(handler=archive)
+
+    items_parser = commands.add_parser('items', help='Кандидаты в каталог предметов')
+    items_parser.add_argument('--db', help='Путь к базе (по умолчанию DB_PATH)')
+    items_parser.add_argument('--add', help='Добавить проверенное название в каталог')
+    items_parser.add_argument('--min-count', type=int, default=2, help='Минимум выпадений')
+    items_parser.add_argument('--limit', type=int, default=50, help='Сколько названий показать')
+    items_parser.set_defaults(handler=items)
+
+    vacuum_parser = commands.add_parser('vacuum', help='Включить incremental vacuum (полный VACUUM)')
+    vacuum_parser.add_argument('--db', help='Путь к базе (по умолчанию DB_PATH)')
+    vacuum_parser.set_defaults(handler=vacuum)
+
+    args = parser.parse_args()
+    return args.handler(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,221 @@
+"""Версионированные миграции базы.
+
+Каждая миграция выполняется один раз: номер применённой записывается в таблицу
+schema_version вместе со временем выполнения. Миграции запускаются при старте
+процесса (main.py, web_app.py, manage.py), а не при каждом подключении бота к
+Discord. Изменение схемы — новая функция в конце MIGRATIONS; уже применённые
+миграции не редактируются.
+
+Базы, созданные до schema_version, проходят все миграции один раз: каждая
+из них безопасна для уже обновлённой базы (IF NOT EXISTS, проверка типов
+столбцов, повторный запуск заполнения пропускает готовые записи).
+"""
+import logging
+import time
+
+from datetime import datetime
+
+from database import (connect, begin_immediate, create_archive_views, parse_legacy_time, backfill_loot_items, rebuild_attendance_rollup,
+                      to_epoch, TABLES, TIME_COLUMNS, INDEXES, ARCHIVE_VIEWS, ATTENDANCE_DAILY_TABLE_SQL,
+                      ROLLUP_TRIGGERS, LOOT_ITEMS_FTS_SQL, LOOT_ITEMS_FTS_TRIGGERS, BOSS_KILL_COUNTS_TABLE_SQL,
+                      BOSS_KILL_COUNTS_INDEX_SQL, BOSS_KILL_COUNTS_TRIGGERS, rebuild_boss_kill_counts,
+                      ATTENDANCE_TOTALS_TABLE_SQL, ATTENDANCE_TOTALS_INDEX_SQL, ATTENDANCE_TOTALS_TRIGGERS,
+                      rebuild_attendance_totals)
+
+logger = logging.getLogger(__name__)
+
+SCHEMA_VERSION_SQL = '''
+    CREATE TABLE IF NOT EXISTS schema_version (
+        version INTEGER PRIMARY KEY,
+        name TEXT,
+        applied_at INTEGER,
+        duration_ms INTEGER
+    )
+'''
+
+
+def create_tables(conn):
+    """Таблицы базы"""
+    for table, columns in TABLES.items():
+        conn.execute(f'CREATE TABLE IF NOT EXISTS {table} ({columns})')
+
+
+def convert_times_to_epoch(conn):
+    """kill_time, respawn и created_at из текста (любой из старых форматов) в секунды Unix.
+
+    Тип столбца в SQLite не меняется, поэтому таблица пересоздаётся: новая
+    таблица с INTEGER-столбцами, перенос строк одним INSERT ... SELECT с
+    преобразованием дат, замена старой таблицы. Нераспознанные даты становятся
+    NULL. Индексы удалены вместе со старыми таблицами и создаются следующими миграциями.
+    """
+    pending = []
+    for table, time_columns in TIME_COLUMNS.items():
+        columns = {row['name']: row['type'] for row in conn.execute(f'PRAGMA main.table_info({table})')}
+        if columns.get(time_columns[0], 'INTEGER').upper() != 'INTEGER':
+            pending.append((table, list(columns)))
+    if not pending:
+        return
+
+    conn.create_function('legacy_epoch', 1, parse_legacy_time, deterministic=True)
+    # Триггеры и представления all_* ссылаются на пересоздаваемые таблицы и мешают
+    # переименованию: снимаем их на время переноса и создаём заново
+    triggers = conn.execute("SELECT name, sql FROM main.sqlite_master WHERE type = 'trigger'").fetchall()
+    for trigger in triggers:
+        conn.execute(f'DROP TRIGGER main.{trigger["name"]}')
+    for view in ARCHIVE_VIEWS:
+        conn.execute(f'DROP VIEW IF EXISTS temp.{view}')
+
+    for table, columns in pending:
+        time_columns = TIME_COLUMNS[table]
+        select = ', '.join(f'legacy_epoch({column})' if column in time_columns else column for column in columns)
+        conn.execute(f'CREATE TABLE main.{table}_new ({TABLES[table]})')
+        converted = conn.execute(f'INSERT INTO main.{table}_new ({", ".join(columns)}) '
+                                 f'SELECT {select} FROM main.{table}').rowcount
+
+        lost = ' OR '.join(f'(new.{column} IS NULL AND old.{column} IS NOT NULL)' for column in time_columns)
+        unparsed = conn.execute(f'SELECT COUNT(*) FROM main.{table}_new new JOIN main.{table} old '
+                                f'ON old.id = new.id WHERE {lost}').fetchone()[0]
+
+        conn.execute(f'DROP TABLE main.{table}')
+        conn.execute(f'ALTER TABLE main.{table}_new RENAME TO {table}')
+        logger.info(f"Таблица {table}: даты переведены в секунды Unix ({converted} строк, "
+                    f"нераспознанных дат: {unparsed})")
+
+    for trigger in triggers:
+        conn.execute(trigger['sql'])
+    create_archive_views(conn)
+
+
+def deduplicate_attendance(conn):
+    """Удаляет дубли отметок участия и создаёт уникальный индекс (boss_kill_id, user_id).
+
+    Дубли появлялись, когда две реакции успевали пройти SELECT до INSERT, и
+    завышали COUNT(*) в статистике. Остаётся самая новая запись пары; если
+    хоть одна копия была с отметкой, отметка сохраняется.
+    """
+    conn.execute('''
+        UPDATE boss_attendance SET attended = 1
+        WHERE attended = 0 AND id IN (
+            SELECT MAX(id) FROM boss_attendance GROUP BY boss_kill_id, user_id
+            HAVING COUNT(*) > 1 AND MAX(attended) = 1
+        )
+    ''')
+    deleted = conn.execute('''
+        DELETE FROM boss_attendance
+        WHERE id NOT IN (SELECT MAX(id) FROM boss_attendance GROUP BY boss_kill_id, user_id)
+    ''').rowcount
+    if deleted:
+        logger.info(f"Удалено повторных отметок участия: {deleted}")
+    conn.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_boss_attendance_kill_user '
+                 'ON boss_attendance (boss_kill_id, user_id)')
+
+
+def create_indexes(conn):
+    """Вторичные индексы частых запросов (database.INDEXES)"""
+    for statement in INDEXES:
+        conn.execute(statement)
+    # Ожидающие респавна берутся из SpawnIndex в памяти бота
+    conn.execute('DROP INDEX IF EXISTS idx_boss_kills_pending')
+
+
+def create_attendance_rollup(conn):
+    """Сводка участия attendance_daily, её триггеры и заполнение по накопленным отметкам"""
+    conn.execute(ATTENDANCE_DAILY_TABLE_SQL)
+    for statement in ROLLUP_TRIGGERS:
+        conn.execute(statement)
+    rows = rebuild_attendance_rollup(conn.cursor())
+    logger.info(f"Сводка участия построена: {rows} строк")
+
+
+def create_loot_items_search(conn):
+    """Полнотекстовый индекс loot_items_fts и раскладка старого дропа по предметам.
+
+    Раскладка идёт в транзакции миграции, под её блокировкой записи: второй
+    процесс ждёт и видит уже разложенный дроп. После сбоя миграция
+    откатывается целиком и повторяется при следующем старте.
+    """
+    conn.execute(LOOT_ITEMS_FTS_SQL)
+    for statement in LOOT_ITEMS_FTS_TRIGGERS:
+        conn.execute(statement)
+    loots, items = backfill_loot_items(conn)
+    logger.info(f"Дроп разложен по предметам: {items} предметов из {loots} записей")
+
+
+def create_boss_kill_counts(conn):
+    """Счётчики убийств boss_kill_counts для топа боссов, их триггеры и заполнение"""
+    conn.execute(BOSS_KILL_COUNTS_TABLE_SQL)
+    conn.execute(BOSS_KILL_COUNTS_INDEX_SQL)
+    for statement in BOSS_KILL_COUNTS_TRIGGERS:
+        conn.execute(statement)
+    rows = rebuild_boss_kill_counts(conn.cursor())
+    logger.info(f"Счётчики убийств построены: {rows} боссов")
+
+
+def create_attendance_totals(conn):
+    """Итоги участия attendance_totals для топа за всё время, их триггеры и заполнение"""
+    conn.execute(ATTENDANCE_TOTALS_TABLE_SQL)
+    conn.execute(ATTENDANCE_TOTALS_INDEX_SQL)
+    for statement in ATTENDANCE_TOTALS_TRIGGERS:
+        conn.execute(statement)
+    rows = rebuild_attendance_totals(conn.cursor())
+    logger.info(f"Итоги участия построены: {rows} игроков")
+
+
+MIGRATIONS = [
+    (1, 'таблицы', create_tables),
+    (2, 'время в секундах Unix', convert_times_to_epoch),
+    (3, 'уникальные отметки участия', deduplicate_attendance),
+    (4, 'индексы', create_indexes),
+    (5, 'сводка участия', create_attendance_rollup),
+    (6, 'поиск по предметам дропа', create_loot_items_search),
+    (7, 'счётчики убийств боссов', create_boss_kill_counts),
+    (8, 'индекс игроков для страницы админа', create_indexes),
+    (9, 'итоги участия за всё время', create_attendance_totals),
+]
+
+
+def current_version(conn):
+    return conn.execute('SELECT COALESCE(MAX(version), 0) FROM schema_version').fetchone()[0]
+
+
+def migrate(conn=None):
+    """Применяет недостающие миграции; возвращает номер версии схемы.
+
+    Каждая миграция и запись о ней — одна транзакция BEGIN IMMEDIATE без
+    промежуточных фиксаций: второй процесс, стартующий одновременно, ждёт
+    блокировку и видит уже применённую версию.
+    """
+    own = conn is None
+    if own:
+        conn = connect()
+    try:
+        conn.execute(SCHEMA_VERSION_SQL)
+        conn.commit()
+        start = time.perf_counter()
+        applied = 0
+        for version, name, migration in MIGRATIONS:
+            begin_immediate(conn)
+            try:
+                if version <= current_version(conn):
+                    conn.rollback()
+                    continue
+                step = time.perf_counter()
+                migration(conn)
+                duration_ms = int((time.perf_counter() - step) * 1000)
+                conn.execute('INSERT INTO schema_version (version, name, applied_at, duration_ms) '
+                             'VALUES (?, ?, ?, ?)', (version, name, to_epoch(datetime.now()), duration_ms))
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                logger.error(f"Миграция {version} ({name}) не применена")
+                raise
+            applied += 1
+            logger.info(f"Миграция {version} ({name}) применена за {duration_ms} мс")
+
+        version = current_version(conn)
+        if applied:
+            logger.info(f"Схема базы обновлена до версии {version} за {time.perf_counter() - start:.2f} с")
+        return version
+    finally:
+        if own:
+            conn.close()
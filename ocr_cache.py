@@ -0,0 +1,135 @@
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+import time
+
+import numpy as np
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+STAT_NAMES = ('hits', 'phash_hits', 'misses', 'evictions')
+
+
+def content_hash(image_data):
+    """Хеш содержимого файла: одинаковые байты — одинаковый ключ"""
+    return hashlib.sha256(image_data).hexdigest()
+
+
+def region_hash(region, columns=128):
+    """dHash области лога чата: совпадает у копий скриншота с тем же текстом.
+
+    Хешируется только обрезанная область чата, а не весь кадр: в dHash 9x8
+    всего кадра строки чата не влияют ни на один бит, и скриншоты одной сцены
+    с разным дропом получали одинаковый хеш. Сетка в 128 столбцов мельче
+    ширины буквы, поэтому другой текст меняет хеш (проверка:
+    python -m benchmarks.cache_collisions). Плата за это — пересжатая с
+    потерями копия обычно тоже даёт другой хеш и распознаётся заново.
+    """
+    width, height = region.size
+    rows = max(8, round(columns * height / width))
+    gray = np.asarray(region.convert('L').resize((columns + 1, rows), Image.BILINEAR), dtype=np.int16)
+    return hashlib.sha256(np.packbits(gray[:, :-1] < gray[:, 1:]).tobytes()).hexdigest()
+
+
+class OcrCache:
+    """Постоянный кеш результатов OCR: хеш изображения → список предметов.
+
+    Хранится в отдельном SQLite файле, чтобы не мешать основной базе бота.
+    Им пользуются сразу несколько процессов пула, поэтому счётчики попаданий
+    тоже лежат в базе.
+    """
+
+    def __init__(self, path, max_entries):
+        self.path = path
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=10, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        columns = [row[1] for row in self._conn.execute('PRAGMA table_info(ocr_cache)')]
+        if columns and 'region_hash' not in columns:
+            # Кеш со старым хешем всего кадра: его записи по похожести недостоверны
+            logger.info("Кеш OCR со старым перцептивным хешем очищен")
+            self._conn.execute('DROP TABLE ocr_cache')
+        self._conn.executescript('''
+            CREATE TABLE IF NOT EXISTS ocr_cache (
+                content_hash TEXT PRIMARY KEY,
+                region_hash TEXT,
+                items TEXT,
+                created_at REAL,
+                last_used REAL
+            );
+            CREATE INDEX IF NOT EXISTS idx_ocr_cache_region_hash ON ocr_cache (region_hash);
+            CREATE INDEX IF NOT EXISTS idx_ocr_cache_last_used ON ocr_cache (last_used);
+            CREATE TABLE IF NOT EXISTS ocr_cache_stats (
+                name TEXT PRIMARY KEY,
+                value INTEGER DEFAULT 0
+            );
+        ''')
+        self._conn.executemany(
+            'INSERT OR IGNORE INTO ocr_cache_stats (name, value) VALUES (?, 0)',
+            [(name,) for name in STAT_NAMES]
+        )
+        self._conn.commit()
+
+    def _bump(self, name, amount=1):
+        self._conn.execute('UPDATE ocr_cache_stats SET value = value + ? WHERE name = ?', (amount, name))
+
+    def _touch(self, key, stat):
+        self._conn.execute('UPDATE ocr_cache SET last_used = ? WHERE content_hash = ?', (time.time(), key))
+        self._bump(stat)
+        self._conn.commit()
+
+    def get(self, key):
+        """Ищет результат по хешу содержимого, None если нет"""
+        with self._lock:
+            row = self._conn.execute('SELECT items FROM ocr_cache WHERE content_hash = ?', (key,)).fetchone()
+            if row is None:
+                return None
+            self._touch(key, 'hits')
+            return json.loads(row[0])
+
+    def get_similar(self, region_hash):
+        """Ищет результат по хешу области чата (копия того же скриншота), None если нет"""
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT content_hash, items FROM ocr_cache WHERE region_hash = ? ORDER BY last_used DESC LIMIT 1',
+                (region_hash,)
+            ).fetchone()
+            if row is None:
+                return None
+            self._touch(row[0], 'phash_hits')
+            return json.loads(row[1])
+
+    def record_miss(self):
+        with self._lock:
+            self._bump('misses')
+            self._conn.commit()
+
+    def put(self, key, region_hash, items):
+        """Сохраняет результат и вытесняет самые давно использованные записи"""
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO ocr_cache (content_hash, region_hash, items, created_at, last_used) '
+                'VALUES (?, ?, ?, ?, ?)',
+                (key, region_hash, json.dumps(items, ensure_ascii=False), now, now)
+            )
+            count = self._conn.execute('SELECT COUNT(*) FROM ocr_cache').fetchone()[0]
+            overflow = count - self.max_entries
+            if overflow > 0:
+                self._conn.execute(
+                    'DELETE FROM ocr_cache WHERE content_hash IN '
+                    '(SELECT content_hash FROM ocr_cache ORDER BY last_used ASC LIMIT ?)',
+                    (overflow,)
+                )
+                self._bump('evictions', overflow)
+            self._conn.commit()
+
+    def stats(self):
+        with self._lock:
+            result = dict(self._conn.execute('SELECT name, value FROM ocr_cache_stats').fetchall())
+            result['entries'] = self._conn.execute('SELECT COUNT(*) FROM ocr_cache').fetchone()[0]
+        return result
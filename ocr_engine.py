@@ -0,0 +1,117 @@
+import logging
+import re
+
+import pytesseract
+
+from config import TESSERACT_CMD, TESSDATA_PATH, OCR_ENGINE
+
+try:
+    import tesserocr
+except ImportError:
+    tesserocr = None
+
+pytesseract.pytesseract.tesseract_cmd = TESSERACT_CMD
+
+logger = logging.getLogger(__name__)
+
+DATA_KEYS = ('text', 'conf', 'page_num', 'block_num', 'par_num', 'line_num')
+
+
+def parse_config(config):
+    """Достаёт --oem и --psm из строки конфига tesseract"""
+    oem = re.search(r'--oem\s+(\d+)', config)
+    psm = re.search(r'--psm\s+(\d+)', config)
+    return (int(oem.group(1)) if oem else 3), (int(psm.group(1)) if psm else 3)
+
+
+class PytesseractEngine:
+    """Запуск процесса tesseract на каждый вызов (через временные файлы)"""
+
+    name = 'pytesseract'
+
+    def __init__(self, lang='eng'):
+        self.lang = lang
+
+    def image_to_data(self, image, config):
+        return pytesseract.image_to_data(image, lang=self.lang, config=config,
+                                         output_type=pytesseract.Output.DICT)
+
+
+class TesserocrEngine:
+    """Tesseract внутри процесса через tesserocr.
+
+    Языковая модель загружается один раз на каждый режим psm, изображения
+    передаются из памяти — без запуска процессов и временных файлов.
+    """
+
+    name = 'tesserocr'
+
+    def __init__(self, lang='eng', path=None):
+        if tesserocr is None:
+            raise RuntimeError("tesserocr не установлен")
+        self.lang = lang
+        self.path = path
+        self._apis = {}
+        # Сразу загружаем модель для основного режима, чтобы ошибка установки была видна при старте
+        self._api(3, 6)
+
+    def _api(self, oem, psm):
+        key = (oem, psm)
+        if key not in self._apis:
+            kwargs = {'lang': self.lang, 'psm': psm, 'oem': oem}
+            if self.path:
+                kwargs['path'] = self.path
+            self._apis[key] = tesserocr.PyTessBaseAPI(**kwargs)
+        return self._apis[key]
+
+    def image_to_data(self, image, config):
+        """Результат в том же формате, что pytesseract.image_to_data(output_type=DICT)"""
+        api = self._api(*parse_config(config))
+        api.SetImage(image)
+        api.Recognize()
+
+        data = {key: [] for key in DATA_KEYS}
+        block = par = line = 0
+        iterator = api.GetIterator()
+        words = tesserocr.iterate_level(iterator, tesserocr.RIL.WORD) if iterator is not None else []
+        for word in words:
+            if word.IsAtBeginningOf(tesserocr.RIL.BLOCK):
+                block, par, line = block + 1, 0, 0
+            if word.IsAtBeginningOf(tesserocr.RIL.PARA):
+                par, line = par + 1, 0
+            if word.IsAtBeginningOf(tesserocr.RIL.TEXTLINE):
+                line += 1
+            text = word.GetUTF8Text(tesserocr.RIL.WORD)
+            if text is None:
+                continue
+            data['text'].append(text)
+            data['conf'].append(word.Confidence(tesserocr.RIL.WORD))
+            data['page_num'].append(1)
+            data['block_num'].append(block)
+            data['par_num'].append(par)
+            data['line_num'].append(line)
+
+        api.Clear()
+        return data
+
+    def close(self):
+        for api in self._apis.values():
+            api.End()
+        self._apis = {}
+
+
+def create_engine(kind=OCR_ENGINE):
+    """Создаёт движок OCR: tesserocr, если доступен, иначе запуск tesseract на каждый вызов"""
+    if kind in ('auto', 'tesserocr'):
+        try:
+            engine = TesserocrEngine(path=TESSDATA_PATH)
+            logger.info("OCR движок: tesserocr (модель загружена в процесс)")
+            return engine
+        except Exception as e:
+            if kind == 'tesserocr':
+                logger.error(f"tesserocr недоступен ({e}), используется pytesseract")
+            else:
+                logger.warning(f"tesserocr недоступен ({e}): OCR через pytesseract, отдельный процесс "
+                               f"tesseract на каждый вызов. Установите tesserocr (pip install tesserocr) "
+                               f"или задайте OCR_ENGINE=pytesseract, чтобы убрать это предупреждение")
+    return PytesseractEngine()
@@ -0,0 +1,472 @@
+import io
+import json
+import logging
+import os
+import re
+import time
+from collections import namedtuple
+from contextlib import contextmanager
+
+import numpy as np
+from PIL import Image, ImageEnhance, ImageOps
+
+from config import (OCR_MAX_BYTES, OCR_MAX_PIXELS, OCR_MIN_CONFIDENCE, OCR_TARGET_TEXT_HEIGHT, OCR_CACHE_PATH,
+                    OCR_CACHE_MAX_ENTRIES, OCR_CACHE_PHASH, OCR_ROI, OCR_ROI_LAYOUTS, DEBUG_CAPTURE_MODE,
+                    DEBUG_CAPTURE_SAMPLE, DEBUG_CAPTURE_DIR, DEBUG_CAPTURE_MAX_FILES, DEBUG_CAPTURE_MAX_MB,
+                    DEBUG_CAPTURE_MAX_AGE_HOURS, ITEM_CATALOGUE_PATH, ITEM_MATCH_MIN_SCORE, ITEM_MATCH_ACCEPT_SCORE,
+                    ITEM_INDEX_REFRESH)
+from debug_capture import DebugCapture
+from image_filters import text_color_mask, find_text_region, normalize_text_scale
+from item_index import ItemIndex, build_item_index
+from ocr_cache import OcrCache, content_hash, region_hash
+from ocr_engine import create_engine
+
+logger = logging.getLogger(__name__)
+
+_cache = None
+_engine = None
+_roi_layouts = None
+_debug_capture = None
+_stage_timings = None
+_item_index = None
+_item_index_loaded = 0.0
+
+# Этапы распознавания: (метод обработки, конфиг tesseract), от дешёвых к дорогим.
+# Метод None означает лучший вариант обработки из уже пройденных этапов.
+OCR_STAGES = [
+    ('GRAY', r'--oem 3 --psm 6'),
+    ('HSV', r'--oem 3 --psm 6'),
+    (None, r'--oem 3 --psm 7'),
+    (None, r'--oem 3 --psm 8'),
+    (None, r'--oem 3 --psm 13'),
+]
+
+# Допустимые символы в названии предмета
+ITEM_PATTERN = re.compile(r"^[A-Za-z0-9][A-Za-z0-9 '+\-:()\[\]]*$")
+
+OcrAttempt = namedtuple('OcrAttempt', 'method config text items confidence match_score')
+
+
+@contextmanager
+def collect_timings():
+    """Собирает время этапов конвейера (для бенчмарков): список пар (этап, секунды)"""
+    global _stage_timings
+    previous, _stage_timings = _stage_timings, []
+    try:
+        yield _stage_timings
+    finally:
+        _stage_timings = previous
+
+
+@contextmanager
+def stage_timer(stage):
+    """Замеряет этап, если включён сбор времени через collect_timings()"""
+    if _stage_timings is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        _stage_timings.append((stage, time.perf_counter() - start))
+
+
+def init_worker(log_file='bot_debug.log', level=logging.INFO):
+    """Настройка процесса-обработчика OCR: логирование и движок tesseract"""
+    handlers = [logging.StreamHandler()]
+    if log_file:
+        handlers.append(logging.FileHandler(log_file, encoding='utf-8'))
+    logging.basicConfig(
+        level=level,
+        format='%(asctime)s - %(levelname)s - [%(processName)s] %(message)s',
+        handlers=handlers
+    )
+    # Модель загружается при старте процесса, а не на первом скриншоте
+    get_engine()
+
+
+def extract_items(text):
+    """Извлекает названия предметов между 'acquired' и 'from'"""
+    logger.info("Извлекаем названия предметов из текста")
+
+    # Регулярное выражение для поиска текста между "acquired" и "from"
+    pattern = r'acquired\s+(.*?)\s+from'
+    items = re.findall(pattern, text, re.IGNORECASE)
+
+    # Очищаем результаты
+    cleaned_items = []
+    for item in items:
+        # Убираем лишние пробелы и переносы строк
+        cleaned_item = ' '.join(item.split())
+        # Убираем возможные точки и запятые в конце
+        cleaned_item = cleaned_item.rstrip('.,')
+        cleaned_items.append(cleaned_item)
+
+    logger.info(f"Найдено {len(cleaned_items)} предметов")
+    return cleaned_items
+
+
+def merge_items(item_lists):
+    """Объединяет предметы с нескольких скриншотов одного сообщения.
+
+    Логи чата на соседних скриншотах перекрываются, поэтому одна и та же строка
+    может попасть в несколько списков. Предмет берётся столько раз, сколько он
+    встретился на самом «богатом» скриншоте, в порядке появления.
+    """
+    counts = {}
+    order = []
+    for items in item_lists:
+        seen = {}
+        for item in items:
+            seen[item] = seen.get(item, 0) + 1
+            if seen[item] > counts.get(item, 0):
+                counts[item] = seen[item]
+                order.append(item)
+    return order
+
+
+def enhance_gray(image):
+    """Вариант 1: простая бинаризация"""
+    logger.info("Применяем серый метод обработки")
+    img = image.convert("L")  # в серый
+    img = ImageOps.autocontrast(img)
+    img = ImageOps.invert(img)  # текст становится чёрным
+    enhancer = ImageEnhance.Sharpness(img)
+    img = enhancer.enhance(2.0)
+    enhancer = ImageEnhance.Contrast(img)
+    img = enhancer.enhance(2.0)
+    return img
+
+
+def enhance_hsv(image):
+    """Вариант 2: HSV фильтрация цветного текста"""
+    logger.info("Применяем HSV метод обработки")
+    img_array = np.asarray(image.convert("RGB"))
+
+    # Маска считается полосами, полный float64 HSV массив не создаётся
+    text_mask = text_color_mask(img_array)
+
+    # Чёрный текст на белом фоне, 1 байт на пиксель
+    return Image.fromarray(np.logical_not(text_mask).astype(np.uint8) * np.uint8(255), 'L')
+
+
+VARIANTS = {
+    'GRAY': enhance_gray,
+    'HSV': enhance_hsv,
+}
+
+
+def get_engine():
+    """Движок OCR процесса: создаётся один раз и живёт, пока жив процесс"""
+    global _engine
+    if _engine is None:
+        _engine = create_engine()
+    return _engine
+
+
+def get_cache():
+    """Кеш результатов OCR (один на процесс, открывается при первом обращении)"""
+    global _cache
+    if _cache is None:
+        _cache = OcrCache(OCR_CACHE_PATH, OCR_CACHE_MAX_ENTRIES)
+    return _cache
+
+
+def get_debug_capture():
+    """Сохранение отладочных материалов (одно на процесс)"""
+    global _debug_capture
+    if _debug_capture is None:
+        _debug_capture = DebugCapture(
+            DEBUG_CAPTURE_DIR,
+            mode=DEBUG_CAPTURE_MODE,
+            sample_every=DEBUG_CAPTURE_SAMPLE,
+            max_files=DEBUG_CAPTURE_MAX_FILES,
+            max_bytes=DEBUG_CAPTURE_MAX_MB * 1024 * 1024,
+            max_age=DEBUG_CAPTURE_MAX_AGE_HOURS * 3600
+        )
+    return _debug_capture
+
+
+def get_item_index():
+    """Словарь предметов процесса; каталог перечитывается раз в ITEM_INDEX_REFRESH секунд"""
+    global _item_index, _item_index_loaded
+    if _item_index is None or time.monotonic() - _item_index_loaded > ITEM_INDEX_REFRESH:
+        try:
+            _item_index = build_item_index(ITEM_CATALOGUE_PATH)
+        except Exception as e:
+            logger.error(f"Ошибка при загрузке словаря предметов: {e}")
+            if _item_index is None:
+                _item_index = ItemIndex([])
+        _item_index_loaded = time.monotonic()
+    return _item_index
+
+
+def snap_items(items):
+    """Заменяет распознанные названия ближайшими известными предметами.
+
+    Возвращает исправленный список и худшую оценку совпадения среди предметов
+    (0.0, если хотя бы один предмет не найден в словаре).
+    """
+    index = get_item_index()
+    snapped = []
+    worst_score = 1.0 if items else 0.0
+    for item in items:
+        name, score = index.match(item, min_score=ITEM_MATCH_MIN_SCORE)
+        if name is not None and name != item:
+            logger.info(f"Исправлено по словарю: '{item}' → '{name}' (оценка {score:.2f})")
+        snapped.append(name or item)
+        worst_score = min(worst_score, score)
+    return snapped, worst_score
+
+
+def get_roi_layouts():
+    """Сохранённые области лога чата по разрешению скриншота"""
+    global _roi_layouts
+    if _roi_layouts is None:
+        _roi_layouts = {}
+        if os.path.exists(OCR_ROI_LAYOUTS):
+            try:
+                with open(OCR_ROI_LAYOUTS, encoding='utf-8') as f:
+                    _roi_layouts = {size: tuple(box) for size, box in json.load(f).items()}
+            except Exception as e:
+                logger.error(f"Не удалось прочитать {OCR_ROI_LAYOUTS}: {e}")
+    return _roi_layouts
+
+
+def select_text_region(image):
+    """Область лога чата: сохранённая для этого разрешения или найденная по проекциям"""
+    width, height = image.size
+    region = get_roi_layouts().get(f"{width}x{height}")
+    source = "сохранённая"
+    if region is None:
+        region = find_text_region(image)
+        source = "найденная"
+
+    if region is None:
+        logger.info("Область текста не найдена, распознаём весь кадр")
+        return None
+
+    left, top, right, bottom = region
+    share = (right - left) * (bottom - top) / (width * height)
+    logger.info(f"Область текста ({source}): {region}, {share:.0%} площади кадра")
+    return region
+
+
+def decode_image(image_data):
+    """Декодирует скриншот в RGB с ограничениями по размеру файла и числу пикселей.
+
+    Размер проверяется по заголовку, до распаковки пикселей. JPEG больше
+    OCR_MAX_PIXELS декодируется сразу уменьшенным (draft: в 2, 4 или 8 раз),
+    остальные форматы такого размера отклоняются.
+    """
+    if len(image_data) > OCR_MAX_BYTES:
+        raise ValueError(f"Файл изображения слишком большой: {len(image_data)} байт (лимит {OCR_MAX_BYTES})")
+
+    image = Image.open(io.BytesIO(image_data))
+    width, height = image.size
+    if width * height > OCR_MAX_PIXELS and image.format == 'JPEG':
+        # draft берёт наибольшее уменьшение, при котором размер не меньше запрошенного,
+        # поэтому запрашиваем половину от допустимого: результат гарантированно в лимите
+        share = (OCR_MAX_PIXELS / (width * height)) ** 0.5 / 2
+        image.draft('RGB', (max(1, int(width * share)), max(1, int(height * share))))
+        logger.info(f"JPEG {width}x{height} декодируется уменьшенным до {image.size[0]}x{image.size[1]}")
+    if image.size[0] * image.size[1] > OCR_MAX_PIXELS:
+        raise ValueError(f"Изображение слишком большое: {width}x{height} (лимит {OCR_MAX_PIXELS} пикселей)")
+
+    image.load()
+    # Конвертируем в RGB если нужно
+    if image.mode != 'RGB':
+        image = image.convert('RGB')
+    return image
+
+
+def peak_memory_bound(pixels, size_bytes):
+    """Верхняя оценка пиковой памяти конвейера на одно изображение, в байтах (без tesseract).
+
+    Исходные байты + RGB кадр (3 байта на пиксель) + копия при конвертации
+    режима (до 4 байт) + варианты обработки по 1 байту на пиксель и их
+    промежуточные копии + обрезанная/масштабированная копия (не больше 3 байт
+    на пиксель кадра или на 4 Мп) + полосы HSV и профиля строк фиксированного
+    размера. При лимитах по умолчанию (20 МБ, 12 Мп) это около 290 МБ.
+    """
+    return size_bytes + 18 * pixels + 64 * 1024 * 1024
+
+
+def recognize_image(image_data, use_cache=True):
+    """Полный цикл распознавания по байтам изображения (выполняется в пуле процессов)
+
+    Изображение декодируется прямо из памяти, без временных файлов.
+    Повторно присланный скриншот берётся из кеша без обработки и OCR.
+    """
+    cache = get_cache() if use_cache else None
+    key = content_hash(image_data)
+    cached = cache.get(key) if cache else None
+    if cached is not None:
+        logger.info(f"Результат OCR взят из кеша ({key[:12]})")
+        return cached
+
+    with stage_timer('decode'):
+        image = decode_image(image_data)
+
+    region = None
+    if OCR_ROI:
+        with stage_timer('roi'):
+            region = select_text_region(image)
+
+    # Похожесть проверяется только по области чата: хеш всего кадра не видит строк дропа
+    similar_key = None
+    if cache and OCR_CACHE_PHASH and region:
+        similar_key = region_hash(image.crop(region))
+        cached = cache.get_similar(similar_key)
+        if cached is not None:
+            logger.info(f"Результат OCR взят из кеша по хешу области чата ({key[:12]})")
+            return cached
+
+    if cache:
+        cache.record_miss()
+    debug = get_debug_capture().session()
+    debug.add_image("01_original", image)
+
+    items = []
+    if region:
+        items = run_ocr(image.crop(region), debug, "roi_")
+        if not items:
+            logger.info("В найденной области предметов нет, распознаём весь кадр")
+    if not items:
+        items = run_ocr(image, debug)
+
+    get_debug_capture().finish(debug, failed=not items)
+
+    # Пустой результат не кешируем: такой скриншот стоит распознать заново
+    if cache and items:
+        cache.put(key, similar_key, items)
+    return items
+
+
+def recognize_file(path, use_cache=True):
+    """Распознаёт файл скриншота; результат и время обработки для пакетной обработки"""
+    start = time.perf_counter()
+    try:
+        with open(path, 'rb') as f:
+            items = recognize_image(f.read(), use_cache=use_cache)
+        error = None
+    except Exception as e:
+        logger.error(f"Ошибка при обработке {path}: {e}")
+        items, error = [], str(e)
+    return {'path': path, 'items': items, 'seconds': round(time.perf_counter() - start, 4), 'error': error}
+
+
+def ocr_with_confidence(image, config):
+    """OCR через image_to_data: текст построчно и средняя уверенность строк с дропом"""
+    data = get_engine().image_to_data(image, config)
+
+    lines = {}
+    for i, word in enumerate(data['text']):
+        conf = float(data['conf'][i])
+        if conf < 0 or not word.strip():
+            continue
+        key = (data['page_num'][i], data['block_num'][i], data['par_num'][i], data['line_num'][i])
+        lines.setdefault(key, []).append((word, conf))
+
+    text_lines = []
+    loot_confidences = []
+    for key in sorted(lines):
+        words = lines[key]
+        line = ' '.join(word for word, _ in words)
+        text_lines.append(line)
+        if 'acquired' in line.lower():
+            loot_confidences.append(sum(conf for _, conf in words) / len(words))
+
+    confidence = sum(loot_confidences) / len(loot_confidences) if loot_confidences else 0.0
+    return '\n'.join(text_lines), confidence
+
+
+def is_well_formed(item):
+    """Похоже ли название на настоящий предмет, а не на мусор OCR"""
+    if len(item) < 3 or not ITEM_PATTERN.match(item):
+        return False
+    letters = sum(1 for c in item if c.isalpha())
+    return letters / len(item) >= 0.5
+
+
+def attempt_score(attempt):
+    """Чем больше корректных предметов и выше уверенность, тем лучше попытка"""
+    good_items = sum(1 for item in attempt.items if is_well_formed(item))
+    return good_items, attempt.match_score, attempt.confidence
+
+
+def is_confident(attempt):
+    """Результат достаточно хорош, чтобы не запускать остальные этапы.
+
+    Подходит либо уверенное распознавание tesseract, либо уверенное совпадение
+    всех предметов со словарём известных предметов.
+    """
+    return (bool(attempt.items)
+            and all(is_well_formed(item) for item in attempt.items)
+            and (attempt.confidence >= OCR_MIN_CONFIDENCE or attempt.match_score >= ITEM_MATCH_ACCEPT_SCORE))
+
+
+def normalize_scale(image):
+    """Приводит высоту строк текста к OCR_TARGET_TEXT_HEIGHT, логирует изменение размера"""
+    if OCR_TARGET_TEXT_HEIGHT <= 0:
+        return image, 1.0
+    with stage_timer('scale'):
+        scaled, height, scale = normalize_text_scale(image, OCR_TARGET_TEXT_HEIGHT)
+    if height is None:
+        logger.info(f"Высота строк не определена, размер {image.width}x{image.height} без изменений")
+    elif scale == 1.0:
+        logger.info(f"Высота строк {height:.0f} px, размер {image.width}x{image.height} без изменений")
+    else:
+        logger.info(f"Высота строк {height:.0f} px → {OCR_TARGET_TEXT_HEIGHT} px: "
+                    f"{image.width}x{image.height} → {scaled.width}x{scaled.height} (x{scale:.2f})")
+    return scaled, scale
+
+
+def run_ocr(image, debug, prefix=""):
+    """Поэтапное распознавание RGB изображения, возвращает список предметов.
+
+    Перед распознаванием изображение масштабируется под размер текста, удобный
+    tesseract. Этапы идут от дешёвых к дорогим и останавливаются на первом
+    уверенном результате.
+    """
+    start = time.perf_counter()
+    image, scale = normalize_scale(image)
+    variants = {}
+    best = None
+    for stage, (method, config) in enumerate(OCR_STAGES, 1):
+        # None — повторяем лучший на данный момент вариант обработки с другим конфигом
+        method = method or (best.method if best else 'GRAY')
+        if method not in variants:
+            with stage_timer(f'enhance:{method}'):
+                variants[method] = VARIANTS[method](image)
+            debug.add_image(f"{prefix}02_{method.lower()}_method", variants[method])
+
+        try:
+            with stage_timer(f'tesseract:{method} {config}'):
+                text, confidence = ocr_with_confidence(variants[method], config)
+        except Exception as e:
+            logger.error(f"Ошибка при распознавании ({method}, {config}): {e}")
+            continue
+
+        debug.add_text(f"{prefix}03_stage{stage}_{method.lower()}_text", text)
+        with stage_timer('extract'):
+            items, match_score = snap_items(extract_items(text))
+        attempt = OcrAttempt(method, config, text, items, confidence, match_score)
+        logger.info(f"Этап {stage}: {method} {config}, предметов {len(attempt.items)}, "
+                    f"уверенность {confidence:.1f}, совпадение со словарём {match_score:.2f}\n{text}")
+
+        if best is None or attempt_score(attempt) > attempt_score(best):
+            best = attempt
+        if is_confident(attempt):
+            logger.info(f"Уверенный результат на этапе {stage} из {len(OCR_STAGES)}, остальные пропущены")
+            break
+
+    logger.info(f"OCR {image.width}x{image.height} (масштаб x{scale:.2f}) занял "
+                f"{time.perf_counter() - start:.2f} с")
+    if best is None:
+        return []
+
+    debug.add_image(f"{prefix}04_final_{best.method}", variants[best.method])
+    logger.info(f"Лучший результат: {best.method} {best.config}, уверенность {best.confidence:.1f}")
+    logger.info(f"Лучший распознанный текст:\n{best.text}")
+    return best.items
@@ -0,0 +1,77 @@
+import asyncio
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import ocr_pipeline
+
+logger = logging.getLogger(__name__)
+
+
+class OcrPool:
+    """Пул процессов для OCR, чтобы распознавание не блокировало event loop бота.
+
+    Одновременно выполняется не больше max_workers задач, остальные ждут в очереди.
+    """
+
+    def __init__(self, max_workers):
+        self.max_workers = max_workers
+        self.queued = 0
+        self.in_flight = 0
+        self.completed = 0
+        self.failed = 0
+        self._executor = None
+        self._slots = None
+
+    def _ensure_started(self):
+        if self._executor is None:
+            # spawn: дочерний процесс не наследует память бота (потоки, сокеты, event loop),
+            # но заново импортирует запускаемый модуль как __mp_main__. Поэтому main.py
+            # настраивает логирование и окружение только под if __name__ == "__main__"
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=ocr_pipeline.init_worker
+            )
+            self._slots = asyncio.Semaphore(self.max_workers)
+            logger.info(f"Запущен пул OCR на {self.max_workers} процесс(ов)")
+
+    async def run(self, func, *args):
+        """Выполняет func(*args) в процессе пула и возвращает результат"""
+        self._ensure_started()
+        if self._slots.locked():
+            logger.info(f"OCR задача ждёт в очереди: {self.stats()}")
+
+        self.queued += 1
+        try:
+            await self._slots.acquire()
+        finally:
+            self.queued -= 1
+
+        self.in_flight += 1
+        try:
+            loop = asyncio.get_running_loop()
+            result = await loop.run_in_executor(self._executor, func, *args)
+            self.completed += 1
+            return result
+        except Exception:
+            self.failed += 1
+            raise
+        finally:
+            self.in_flight -= 1
+            self._slots.release()
+
+    def stats(self):
+        return {
+            'workers': self.max_workers,
+            'queued': self.queued,
+            'in_flight': self.in_flight,
+            'completed': self.completed,
+            'failed': self.failed,
+        }
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+            logger.info("Пул OCR остановлен")
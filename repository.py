@@ -0,0 +1,156 @@
+"""Асинхронный доступ бота к базе.
+
+Все запросы выполняются в одном выделенном потоке (у него своё соединение,
+см. database.get_db_connection), обработчики Discord только ждут результат:
+ожидание блокировки или fsync не останавливает цикл событий.
+"""
+import asyncio
+import logging
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+import archiver
+
+from database import (to_epoch, get_db_connection, close_db_connection, LATEST_SPAWNS_SQL, SPAWN_BY_MESSAGE_SQL,
+                      CLOSE_OPEN_SPAWNS_SQL, UPSERT_ATTENDANCE_SQL, SET_ATTENDED_SQL, INSERT_LOOT_ITEM_SQL)
+
+logger = logging.getLogger(__name__)
+
+Spawn = namedtuple('Spawn', 'id boss_name kill_time respawn message_id channel_id is_killed respawn_notified')
+
+# Один поток: запись в SQLite всё равно последовательная, а порядок операций сохраняется
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='db')
+
+
+def _spawn(row):
+    return Spawn._make(row[field] for field in Spawn._fields) if row else None
+
+
+async def _run(func, *args):
+    return await asyncio.get_running_loop().run_in_executor(_executor, func, *args)
+
+
+def _mark_spawn(boss_name, kill_time, respawn, message_id, channel_id, previous_id):
+    with get_db_connection() as conn:
+        if previous_id is None:
+            # Все прошлые записи этого босса становятся неактуальными
+            conn.execute(CLOSE_OPEN_SPAWNS_SQL, (boss_name,))
+        else:
+            # Прошлое убийство обработано: о респавне сообщили
+            conn.execute('UPDATE boss_kills SET respawn_notified = 1 WHERE id = ?', (previous_id,))
+        cursor = conn.execute(
+            'INSERT INTO boss_kills (boss_name, kill_time, respawn, message_id, channel_id) VALUES (?, ?, ?, ?, ?)',
+            (boss_name, kill_time, respawn, message_id, channel_id)
+        )
+        return Spawn(cursor.lastrowid, boss_name, kill_time, respawn, message_id, channel_id, 0, 0)
+
+
+def _load_latest_spawns():
+    return [_spawn(row) for row in get_db_connection().execute(LATEST_SPAWNS_SQL)]
+
+
+def _find_spawn_by_message(message_id):
+    row = get_db_connection().execute(SPAWN_BY_MESSAGE_SQL, (message_id,)).fetchone()
+    return row['id'] if row else None
+
+
+def _apply_attendance(conn, spawn_id, user_id, username, attended):
+    """Ставит или снимает отметку на открытом соединении"""
+    if attended:
+        conn.execute(UPSERT_ATTENDANCE_SQL, (spawn_id, user_id, username, 1))
+    else:
+        conn.execute(SET_ATTENDED_SQL, (0, spawn_id, user_id))
+
+
+def _record_attendance(spawn_id, user_id, username, attended):
+    with get_db_connection() as conn:
+        _apply_attendance(conn, spawn_id, user_id, username, attended)
+
+
+def _record_attendance_batch(events):
+    with get_db_connection() as conn:
+        for event in events:
+            _apply_attendance(conn, *event)
+
+
+def _record_loot(spawn_id, user_id, username, screenshot_path, loot_text, items):
+    created_at = to_epoch(datetime.now())
+    with get_db_connection() as conn:
+        conn.execute('UPDATE boss_kills SET is_killed = 1 WHERE id = ?', (spawn_id,))
+        cursor = conn.execute(
+            'INSERT INTO boss_loot (boss_kill_id, user_id, username, screenshot_path, loot_text, created_at) VALUES (?, ?, ?, ?, ?, ?)',
+            (spawn_id, user_id, username, screenshot_path, loot_text, created_at)
+        )
+        conn.executemany(INSERT_LOOT_ITEM_SQL, [
+            (cursor.lastrowid, spawn_id, user_id, username, item, created_at) for item in items
+        ])
+
+
+async def mark_spawn(boss_name: str, kill_time: int, respawn: int, message_id: int, channel_id: int,
+                     previous_id: Optional[int] = None) -> Spawn:
+    """Новое появление босса по сообщению-оповещению (время в секундах Unix); возвращает записанное появление.
+
+    Без previous_id (ручной вызов) закрываются все открытые появления босса,
+    с previous_id (автоматический респавн) это убийство помечается обработанным.
+    """
+    return await _run(_mark_spawn, boss_name, kill_time, respawn, message_id, channel_id, previous_id)
+
+
+async def load_latest_spawns() -> List[Spawn]:
+    """Последняя запись каждого босса — начальное состояние SpawnIndex"""
+    return await _run(_load_latest_spawns)
+
+
+async def find_spawn_by_message(message_id: int) -> Optional[int]:
+    """id любого появления по сообщению, в том числе уже неактуального"""
+    return await _run(_find_spawn_by_message, message_id)
+
+
+async def record_attendance(spawn_id: int, user_id: int, username: str, attended: bool) -> None:
+    """Ставит или снимает отметку участия в появлении"""
+    await _run(_record_attendance, spawn_id, user_id, username, attended)
+
+
+async def record_attendance_batch(events: List[Tuple[int, int, str, bool]]) -> None:
+    """Несколько отметок (spawn_id, user_id, username, attended) одной транзакцией"""
+    await _run(_record_attendance_batch, events)
+
+
+async def record_loot(spawn_id: int, user_id: int, username: str, screenshot_path: Optional[str],
+                      loot_text: str, items: List[str]) -> None:
+    """Помечает босса убитым и сохраняет дроп (и по предмету в loot_items) одной транзакцией"""
+    await _run(_record_loot, spawn_id, user_id, username, screenshot_path, loot_text, items)
+
+
+def _archive_batch(before, batch_size):
+    return archiver.archive_batch(get_db_connection(), before, batch_size)
+
+
+def _reclaim_space():
+    return archiver.reclaim_space(get_db_connection())
+
+
+async def archive_old(before: int, batch_size: int) -> Dict[str, int]:
+    """Переносит в архив появления старше before (секунды Unix) и освобождает место.
+
+    Каждая пачка — отдельная задача потока базы, так что реакции и дроп
+    записываются между пачками, а не ждут конца всего переноса.
+    """
+    totals = {}
+    while True:
+        moved = await _run(_archive_batch, before, batch_size)
+        if not moved:
+            break
+        for table, rows in moved.items():
+            totals[table] = totals.get(table, 0) + rows
+    if totals:
+        totals['free_pages'] = await _run(_reclaim_space)
+    return totals
+
+
+async def close() -> None:
+    """Закрывает соединение потока базы и останавливает поток"""
+    await _run(close_db_connection)
+    _executor.shutdown(wait=True)
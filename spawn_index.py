@@ -0,0 +1,60 @@
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class SpawnIndex:
+    """Актуальные появления боссов в памяти бота.
+
+    Для каждого босса хранится последняя запись boss_kills, для каждого
+    сообщения-оповещения — появление, если оно последнее у своего босса.
+    Загружается из базы при старте и обновляется после каждой записи бота,
+    поэтому обработчики реакций и ответов и проверка респавнов обходятся без SQL.
+    """
+
+    def __init__(self):
+        self._latest = {}
+        self._by_message = {}
+
+    def __len__(self):
+        return len(self._latest)
+
+    def load(self, spawns):
+        self._latest = {}
+        self._by_message = {}
+        for spawn in spawns:
+            self.put(spawn)
+        logger.info(f"Загружены актуальные появления боссов: {len(self._latest)}")
+
+    def put(self, spawn):
+        """Новая запись становится последней для своего босса"""
+        previous = self._latest.get(spawn.boss_name)
+        if previous is not None:
+            self._by_message.pop(previous.message_id, None)
+        self._latest[spawn.boss_name] = spawn
+        self._by_message[spawn.message_id] = spawn
+
+    def update(self, spawn_id, **changes):
+        """Изменяет поля появления, если оно всё ещё последнее у своего босса"""
+        for boss_name, spawn in self._latest.items():
+            if spawn.id == spawn_id:
+                updated = spawn._replace(**changes)
+                self._latest[boss_name] = updated
+                self._by_message[updated.message_id] = updated
+                return updated
+        return None
+
+    def active(self, message_id):
+        """Появление по сообщению-оповещению, если это последняя запись его босса"""
+        return self._by_message.get(message_id)
+
+    def latest(self, boss_name):
+        return self._latest.get(boss_name)
+
+    def due(self, now):
+        """Убитые боссы, респавн которых наступил к now (секунды Unix), а уведомления ещё не было"""
+        return [
+            spawn for spawn in self._latest.values()
+            if spawn.is_killed and not spawn.respawn_notified
+            and spawn.respawn is not None and spawn.respawn <= now
+        ]
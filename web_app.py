@@ -4,8 +4,12 @@ import sqlite3
 import json
 import logging
 import os
+import re
 
-from database import init_db, get_db_connection, insert_test_data
+import migrations
+from database import (get_db_connection, insert_test_data, to_epoch, format_time, leaderboard_query,
+                      UPCOMING_SPAWNS_SQL, TOP_BOSSES_SQL, RECENT_LOOT_SQL, LOOT_SEARCH_SQL,
+                      ITEM_DROP_COUNTS_SQL, ADMIN_BOSSES_SQL, ADMIN_MEMBERS_SQL)
 
 # Настройка логирования
 logging.basicConfig(
@@ -27,6 +31,8 @@ urls = (
     '/login', 'Login',
     '/logout', 'Logout',
     '/api/boss_spawn', 'ApiBossSpawn',
+    '/api/loot/search', 'ApiLootSearch',
+    '/api/loot/items', 'ApiLootItems',
     '/static/(.*)', 'Static',
     '/.*', 'NotFound'
 )
@@ -38,16 +44,20 @@ render = web.template.render('templates/')  # без base='base'
 # Конфигурация
 DB_PATH = 'crp_clan.db'
 
+# Верхняя граница выдачи API дропа
+API_MAX_LIMIT = 500
+
+# Конец периода «без конца» в секундах Unix
+FAR_FUTURE = 2 ** 62
+
 
 def safe_db_query(query, params=()):
     """Безопасное выполнение запроса к базе данных с обработкой ошибок"""
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
+        # Соединение потока веб-сервера переиспользуется между запросами
+        cursor = get_db_connection().cursor()
         cursor.execute(query, params)
-        result = cursor.fetchall()
-        conn.close()
-        return result
+        return cursor.fetchall()
     except sqlite3.Error as e:
         logger.error(f"Ошибка базы данных: {e}")
         return []
@@ -56,6 +66,55 @@ def safe_db_query(query, params=()):
         return []
 
 
+def with_formatted_times(rows, *columns):
+    """Строки запроса как словари, столбцы времени (секунды Unix) — строками для шаблонов"""
+    result = []
+    for row in rows:
+        item = dict(row)
+        for column in columns:
+            item[column] = format_time(item.get(column))
+        result.append(item)
+    return result
+
+
+def period_bounds(time_range):
+    """Начало и конец периода страницы статистики (datetime или None — без границы)"""
+    now = datetime.now()
+    if time_range == 'week':
+        return now - timedelta(days=7), None
+    if time_range == 'last_week':
+        return now - timedelta(days=14), now - timedelta(days=7)
+    if time_range == 'month':
+        return now - timedelta(days=30), None
+    return None, None
+
+
+def epoch_bounds(time_range):
+    """Период в секундах Unix для запросов по created_at"""
+    start, end = period_bounds(time_range)
+    return (to_epoch(start) if start else 0), (to_epoch(end) if end else FAR_FUTURE)
+
+
+def fts_query(text):
+    """Запрос FTS5 из ввода пользователя: все слова обязательны, последнее — как начало слова"""
+    words = re.findall(r'\w+', text)
+    if not words:
+        return None
+    return ' '.join(f'"{word}"' for word in words) + '*'
+
+
+def api_limit(value, default=50):
+    try:
+        return max(1, min(int(value), API_MAX_LIMIT))
+    except (TypeError, ValueError):
+        return default
+
+
+def json_response(data):
+    web.header('Content-Type', 'application/json; charset=utf-8')
+    return json.dumps(data, ensure_ascii=False)
+
+
 class Static:
     def GET(self, path):
         try:
@@ -68,14 +127,10 @@ class Static:
 class Index:
     def GET(self):
         try:
-            # Ближайшие боссы в течение 24 часов
-            upcoming_bosses = safe_db_query('''
-                SELECT boss_name, respawn 
-                FROM boss_kills 
-                WHERE datetime(respawn) > datetime('now') 
-                AND datetime(respawn) < datetime('now', '+1 day')
-                ORDER BY respawn ASC
-            ''')
+            # Ближайшие боссы в течение 24 часов: диапазон по индексу respawn
+            now = to_epoch(datetime.now())
+            day_later = to_epoch(datetime.now() + timedelta(days=1))
+            upcoming_bosses = with_formatted_times(safe_db_query(UPCOMING_SPAWNS_SQL, (now, day_later)), 'respawn')
 
             # Если нет данных, используем тестовые
             if not upcoming_bosses:
@@ -85,14 +140,7 @@ class Index:
                 ]
 
             # Топ боссов по убийствам
-            top_bosses = safe_db_query('''
-                SELECT boss_name, COUNT(*) as kill_count
-                FROM boss_kills 
-                WHERE is_killed = 1
-                GROUP BY boss_name 
-                ORDER BY kill_count DESC 
-                LIMIT 10
-            ''')
+            top_bosses = safe_db_query(TOP_BOSSES_SQL)
 
             if not top_bosses:
                 top_bosses = [
@@ -102,17 +150,8 @@ class Index:
                 ]
 
             # Топ игроков за неделю
-            week_ago = (datetime.now() - timedelta(days=7)).strftime("%Y-%m-%d %H:%M")
-            top_players = safe_db_query('''
-                SELECT username, COUNT(*) as attendance_count
-                FROM boss_attendance 
-                INNER JOIN boss_kills ON boss_attendance.boss_kill_id = boss_kills.id
-                WHERE boss_attendance.attended = 1 
-                AND boss_kills.kill_time >= ?
-                GROUP BY boss_attendance.user_id 
-                ORDER BY attendance_count DESC 
-                LIMIT 10
-            ''', (week_ago,))
+            week_ago = datetime.now() - timedelta(days=7)
+            top_players = safe_db_query(*leaderboard_query(week_ago, limit=10))
 
             if not top_players:
                 top_players = [
@@ -145,13 +184,7 @@ class Index:
 class Loot:
     def GET(self):
         try:
-            loot_data = safe_db_query('''
-                SELECT bl.*, bk.boss_name, bk.kill_time
-                FROM boss_loot bl
-                JOIN boss_kills bk ON bl.boss_kill_id = bk.id
-                ORDER BY bl.created_at DESC
-                LIMIT 50
-            ''')
+            loot_data = with_formatted_times(safe_db_query(RECENT_LOOT_SQL), 'created_at', 'kill_time')
 
             if not loot_data:
                 loot_data = [
@@ -194,57 +227,8 @@ class Stats:
         try:
             time_range = web.input().get('range', 'week')
 
-            # Определяем период для статистики
-            if time_range == 'week':
-                date_filter = (datetime.now() - timedelta(days=7)).strftime("%Y-%m-%d %H:%M")
-                query = '''
-                    SELECT ba.username, COUNT(*) as attendance_count
-                    FROM boss_attendance ba
-                    INNER JOIN boss_kills bk ON ba.boss_kill_id = bk.id
-                    WHERE ba.attended = 1 
-                    AND bk.kill_time >= ?
-                    GROUP BY ba.user_id 
-                    ORDER BY attendance_count DESC
-                '''
-                params = (date_filter,)
-            elif time_range == 'last_week':
-                start_date = (datetime.now() - timedelta(days=14)).strftime("%Y-%m-%d %H:%M")
-                end_date = (datetime.now() - timedelta(days=7)).strftime("%Y-%m-%d %H:%M")
-                query = '''
-                    SELECT ba.username, COUNT(*) as attendance_count
-                    FROM boss_attendance ba
-                    INNER JOIN boss_kills bk ON ba.boss_kill_id = bk.id
-                    WHERE ba.attended = 1 
-                    AND bk.kill_time >= ? AND bk.kill_time < ?
-                    GROUP BY ba.user_id 
-                    ORDER BY attendance_count DESC
-                '''
-                params = (start_date, end_date)
-            elif time_range == 'month':
-                date_filter = (datetime.now() - timedelta(days=30)).strftime("%Y-%m-%d %H:%M")
-                query = '''
-                    SELECT ba.username, COUNT(*) as attendance_count
-                    FROM boss_attendance ba
-                    INNER JOIN boss_kills bk ON ba.boss_kill_id = bk.id
-                    WHERE ba.attended = 1 
-                    AND bk.kill_time >= ?
-                    GROUP BY ba.user_id 
-                    ORDER BY attendance_count DESC
-                '''
-                params = (date_filter,)
-            else:
-                query = '''
-                    SELECT ba.username, COUNT(*) as attendance_count
-                    FROM boss_attendance ba
-                    INNER JOIN boss_kills bk ON ba.boss_kill_id = bk.id
-                    WHERE ba.attended = 1 
-                    GROUP BY ba.user_id 
-                    ORDER BY attendance_count DESC
-                '''
-                params = ()
-
-            # Статистика по игрокам
-            player_stats = safe_db_query(query, params)
+            # Статистика по игрокам: итоги за всё время или сводка по дням и отметки неполных дней на краях периода
+            player_stats = safe_db_query(*leaderboard_query(*period_bounds(time_range)))
 
             if not player_stats:
                 player_stats = [
@@ -271,8 +255,8 @@ class Admin:
             raise web.seeother('/login')
 
         try:
-            bosses = safe_db_query('SELECT DISTINCT boss_name FROM boss_kills ORDER BY boss_name')
-            members = safe_db_query('SELECT DISTINCT user_id, username FROM boss_attendance ORDER BY username')
+            bosses = safe_db_query(ADMIN_BOSSES_SQL)
+            members = safe_db_query(ADMIN_MEMBERS_SQL)
 
             if not bosses:
                 bosses = [{'boss_name': 'Venatus - 60 LV'}, {'boss_name': 'Ego - 70 LV'}]
@@ -307,6 +291,27 @@ class ApiBossSpawn:
         return json.dumps({'status': 'success', 'message': f'Босс {boss_name} отмечен как появившийся'})
 
 
+class ApiLootSearch:
+    def GET(self):
+        """Кто и когда получал предмет: /api/loot/search?q=epic sword&range=month"""
+        data = web.input(q='', range='all', limit=50)
+        query = fts_query(data.q)
+        if query is None:
+            return json_response([])
+        start, end = epoch_bounds(data.range)
+        rows = safe_db_query(LOOT_SEARCH_SQL, (query, start, end, query, start, end, api_limit(data.limit)))
+        return json_response(with_formatted_times(rows, 'created_at'))
+
+
+class ApiLootItems:
+    def GET(self):
+        """Сколько раз выпадал каждый предмет: /api/loot/items?range=week"""
+        data = web.input(range='all', limit=100)
+        start, end = epoch_bounds(data.range)
+        rows = safe_db_query(ITEM_DROP_COUNTS_SQL, (start, end, api_limit(data.limit, 100)))
+        return json_response(with_formatted_times(rows, 'last_drop'))
+
+
 class Login:
     def GET(self):
         return render.login()
@@ -335,8 +340,8 @@ class NotFound:
 
 
 if __name__ == "__main__":
-    # Инициализируем базу данных
-    init_db()
+    # Создаём или обновляем схему базы
+    migrations.migrate()
 
     # Добавляем тестовые данные, если база пустая
     try:
@@ -344,7 +349,6 @@ if __name__ == "__main__":
         cursor = conn.cursor()
         cursor.execute("SELECT COUNT(*) FROM boss_kills")
         count = cursor.fetchone()[0]
-        conn.close()
 
         if count == 0:
             insert_test_data()